@@ -0,0 +1,202 @@
+"""
+Benchmarks for the hot paths in qcsv.
+
+A synthetic CSV file is generated with a controlled shape (rows,
+columns, type mix, NULL density, string cardinality and quoting), and
+each benchmark is timed on it. Peak memory is measured in a separate
+run with tracemalloc, so that tracing doesn't skew the timings. Results
+are written as JSON, and may be compared with an earlier run:
+
+    python misc/benchmark.py --rows 100000 -o new.json --compare old.json
+"""
+from __future__ import absolute_import, division, print_function
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import numpy as np  # noqa: E402
+import qcsv  # noqa: E402
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def generate(fname, rows, types, nulls, cardinality, quoting, seed):
+    """
+    `generate` writes a CSV file with a header and `rows` rows, where
+    column `i` has the type `types[i]` (`int`, `float` or `str`). Each
+    cell is empty with probability `nulls`, strings are drawn from
+    `cardinality` distinct values and each string is quoted (with an
+    embedded delimiter) with probability `quoting`.
+    """
+    rng = random.Random(seed)
+    words = ['value %d' % i for i in range(cardinality)]
+
+    def cell(typ):
+        if rng.random() < nulls:
+            return ''
+        if typ == 'int':
+            return str(rng.randint(-10 ** 6, 10 ** 6))
+        if typ == 'float':
+            return repr(rng.uniform(-1000, 1000))
+        s = rng.choice(words)
+        if rng.random() < quoting:
+            s = s.replace(' ', ', ')
+        return s
+    with open(fname, 'w') as f:
+        w = csv.writer(f, lineterminator='\n')
+        w.writerow(['%s%d' % (typ, i) for i, typ in enumerate(types)])
+        for _ in range(rows):
+            w.writerow([cell(typ) for typ in types])
+
+
+def benchmarks(fname):
+    """
+    `benchmarks` returns a list of `(name, setup, f)` triples, where
+    `setup` builds the input for `f` outside of the measurement.
+    """
+    def raw():
+        return qcsv.Table(None, *qcsv._data(fname))
+
+    def inferred():
+        t = raw()
+        return t._replace(types=qcsv._column_types(t.names, t.rows))
+
+    def loaded():
+        return qcsv.read(fname)
+
+    def identity(typ, name, r, c, cell):
+        return cell
+
+    def print_table(table):
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            qcsv.print_data_table(table)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    def nothing():
+        return None
+    return [
+        ('read', nothing, lambda _: qcsv.read(fname)),
+        ('read_columnar', nothing,
+         lambda _: qcsv.read(fname, columnar=True)),
+        ('_data', nothing, lambda _: qcsv._data(fname)),
+        ('_column_types', raw, lambda t: qcsv._column_types(t.names, t.rows)),
+        ('cast', inferred, qcsv.cast),
+        ('map_data', loaded, lambda t: qcsv.map_data(t, identity)),
+        ('column', loaded,
+         lambda t: [qcsv.column(t, name) for name in t.names]),
+        ('columns', loaded, qcsv.columns),
+        ('frequencies', loaded,
+         lambda t: [qcsv.frequencies(col) for col in qcsv.columns(t)]),
+        ('print_data_table', loaded, print_table),
+    ]
+
+
+def measure(setup, f, repeat):
+    """
+    `measure` returns the times of `repeat` runs of `f` and its peak
+    memory allocation in bytes (or `None` without tracemalloc).
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.time()
+        f(arg)
+        times.append(time.time() - start)
+    peak = None
+    if tracemalloc is not None:
+        arg = setup()
+        tracemalloc.start()
+        f(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return times, peak
+
+
+def compare(results, fname):
+    """
+    `compare` prints the ratio of each benchmark's best time and peak
+    memory to the same benchmark in the results saved in `fname`.
+    """
+    with open(fname) as f:
+        old = dict((r['name'], r) for r in json.load(f)['results'])
+    print('%-18s %10s %10s' % ('benchmark', 'time', 'memory'))
+    for r in results:
+        if r['name'] not in old:
+            continue
+        o = old[r['name']]
+        mem = '-'
+        if r['peak_bytes'] and o['peak_bytes']:
+            mem = '%.2fx' % (r['peak_bytes'] / o['peak_bytes'])
+        print('%-18s %9.2fx %10s' % (r['name'], r['best'] / o['best'], mem))
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    p.add_argument('--rows', type=int, default=100000)
+    p.add_argument('--types', default='int,float,str,int,float,str',
+                   help='comma separated column types')
+    p.add_argument('--nulls', type=float, default=0.05,
+                   help='probability that a cell is empty')
+    p.add_argument('--cardinality', type=int, default=100,
+                   help='number of distinct strings')
+    p.add_argument('--quoting', type=float, default=0.1,
+                   help='probability that a string is quoted')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--only', help='comma separated benchmark names')
+    p.add_argument('-o', '--output', help='write JSON results here')
+    p.add_argument('--compare', help='JSON results to compare against')
+    args = p.parse_args()
+
+    shape = dict((k, getattr(args, k)) for k in
+                 ('rows', 'types', 'nulls', 'cardinality', 'quoting', 'seed'))
+    tmp = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmp, 'bench.csv')
+        generate(fname, args.rows, args.types.split(','), args.nulls,
+                 args.cardinality, args.quoting, args.seed)
+        only = args.only.split(',') if args.only else None
+        results = []
+        for name, setup, f in benchmarks(fname):
+            if only is not None and name not in only:
+                continue
+            times, peak = measure(setup, f, args.repeat)
+            results.append({'name': name, 'best': min(times), 'times': times,
+                            'peak_bytes': peak})
+            print('%-18s %8.3fs %10s' % (
+                name, min(times),
+                '-' if peak is None else '%.1fMB' % (peak / 2 ** 20)))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'shape': shape,
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
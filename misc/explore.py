@@ -8,15 +8,19 @@ import qcsv
 # in descending order.
 def print_freqs(table, colname, limit=25):
     col = qcsv.column(table, colname)
-    freqs = qcsv.frequencies(col)
-    desc = sorted(freqs, key=lambda k: freqs[k], reverse=True)
-    for value in desc[:25]:
-        print '%d %s' % (freqs[value], qcsv.cell_str(value))
+    for value, freq in qcsv.top_frequencies(col, limit):
+        print '%d %s' % (freq, qcsv.cell_str(value))
+
+# Report loading progress, since big files take a while.
+def progress(stage, rows, seconds):
+    sys.stderr.write('%s: %d rows in %.1fs\n' % (stage, rows, seconds))
 
 f = "/home/andrew/tmp/kait/chit.csv"
-table = qcsv.read(f)
+stats = qcsv.Stats(progress=progress)
+table = qcsv.read(f, stats=stats)
 
 # Show our progress.
+print stats.report()
 print 'Table read. Performing analysis.'
 print
 sys.stdout.flush()
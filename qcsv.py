@@ -6,14 +6,94 @@ Currently, only int, float and string types are supported.
 from collections import namedtuple
 """
 from __future__ import absolute_import, division, print_function
-from collections import namedtuple
+import bz2
+from collections import Counter, deque, namedtuple
+import contextlib
 import csv
+import functools
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import locale
+import mmap
+import multiprocessing
+import operator
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from operator import itemgetter
 
 import numpy as np
 
+try:
+    import lzma
+except ImportError:
+    lzma = None
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
 __pdoc__ = {}
 
-Table = namedtuple('Table', ['types', 'names', 'rows'])
+
+class _Indexed(object):
+    """
+    `_Indexed` gives a table namedtuple a case insensitive index of its
+    column names. It is computed once per table.
+    """
+    @property
+    def name_index(self):
+        """
+        A dictionary mapping lowercase column names to column indices.
+        When two names differ only by case, the first one wins.
+        """
+        if '_name_index' not in self.__dict__:
+            self.__dict__['_name_index'] = _name_index(self.names)
+        return self.__dict__['_name_index']
+
+    def column_index(self, colname):
+        """
+        `column_index` returns the index of the column with name
+        `colname`, ignoring case.
+        """
+        i = self.name_index.get(colname.lower())
+        assert i is not None, 'Column name %s does not exist' % colname
+        return i
+
+
+def _name_index(names):
+    """
+    `_name_index` returns a dictionary mapping each lowercase name in
+    `names` to its index, as described in `qcsv.Table.name_index`.
+    """
+    index = {}
+    for i, name in enumerate(names):
+        index.setdefault(name.lower(), i)
+    return index
+
+
+class Table(_Indexed, namedtuple('Table', ['types', 'names', 'rows'])):
+    """
+    A table of data stored as a list of rows, as returned by
+    `qcsv.read`.
+    """
+
+
 __pdoc__['Table.types'] = '''
 Contains inferred type information for each column in the table
 as a dictionary mapping type name to a Python type constructor.
@@ -39,21 +119,263 @@ The name of this column.
 __pdoc__['Column.cells'] = '''
 A list of list of all data in this column. Each datum is guaranteed to
 have type `float`, `int`, `str` or will be the `None` value.
+
+When the column comes from a `qcsv.ColumnTable`, this is the table's
+own masked array (or `qcsv.Categorical`) for the column and not a copy.
 '''
 
+
+class ColumnTable(_Indexed,
+                  namedtuple('ColumnTable', ['types', 'names', 'columns'])):
+    """
+    A table of data stored as a list of columns, as returned by
+    `qcsv.read` with `columnar` set.
+    """
+
+
+__pdoc__['ColumnTable.types'] = '''
+The same as `qcsv.Table.types`.
+'''
+__pdoc__['ColumnTable.names'] = '''
+The same as `qcsv.Table.names`.
+'''
+__pdoc__['ColumnTable.columns'] = '''
+A list of columns in the same order as `qcsv.ColumnTable.names`.
+Each column is a NumPy masked array, where masked cells correspond
+to `None` values. Columns with type `int` or `float` are stored as
+`int64` or `float64` arrays, and columns with type `str` are stored
+as arrays of Python strings (rather than fixed width unicode arrays,
+which pad every cell to the length of the longest one). If the values
+in a column don't fit its type (e.g., an integer that overflows
+`int64`), then the column is stored as an array of Python objects
+instead.
+
+Columns with type `str` may also be dictionary encoded as a
+`qcsv.Categorical` (see `qcsv.categorize`).
+'''
+
+
+class Categorical(namedtuple('Categorical', ['codes', 'categories'])):
+    """
+    A dictionary encoded column of a `qcsv.ColumnTable`, as returned by
+    `qcsv.categorize`. Each distinct value is stored once.
+    """
+    def decode(self):
+        """
+        `decode` returns the cells of this column as a masked array.
+        """
+        if len(self.categories) == 0:
+            data = np.empty(len(self.codes), dtype=self.categories.dtype)
+        else:
+            data = self.categories[np.ma.getdata(self.codes)]
+        return np.ma.array(data, mask=np.ma.getmask(self.codes))
+
+    def tolist(self):
+        """
+        `tolist` returns the cells of this column as a list, where NULL
+        cells are `None`.
+        """
+        return self.decode().tolist()
+
+
+__pdoc__['Categorical.codes'] = '''
+A masked `int32` array with the index into `qcsv.Categorical.categories`
+of each cell's value. Masked cells are NULL.
+'''
+__pdoc__['Categorical.categories'] = '''
+An array of the distinct values in the column, in the order that they
+are first seen.
+'''
+
+LazyTable = namedtuple('LazyTable', ['types', 'names', 'table', 'ops'])
+__pdoc__['LazyTable.types'] = '''
+The same as `qcsv.Table.types`, after all pending operations.
+'''
+__pdoc__['LazyTable.names'] = '''
+The same as `qcsv.Table.names`, after all pending operations.
+'''
+__pdoc__['LazyTable.table'] = '''
+The `qcsv.Table` or `qcsv.ColumnTable` that operations are applied to.
+'''
+__pdoc__['LazyTable.ops'] = '''
+A tuple with a tuple of pending cell functions for each column.
+'''
+
+Stage = namedtuple('Stage', ['name', 'seconds', 'rows', 'bytes',
+                             'peak_bytes'])
+__pdoc__['Stage.name'] = '''
+The name of the stage, e.g., `load` or `cast`.
+'''
+__pdoc__['Stage.seconds'] = '''
+The wall time of the stage in seconds.
+'''
+__pdoc__['Stage.rows'] = '''
+The number of rows the stage produced, or `None` if it isn't known.
+'''
+__pdoc__['Stage.bytes'] = '''
+The number of bytes of input the stage read, or `None` if it didn't
+read a file.
+'''
+__pdoc__['Stage.peak_bytes'] = '''
+The peak memory allocated during the stage, as measured by
+`tracemalloc`, or `None` unless `memory` was set on `qcsv.Stats`.
+'''
+
+
+class Stats(object):
+    """
+    `Stats` records a `qcsv.Stage` for each step of `qcsv.read`, and for
+    `qcsv.cast`, `qcsv.map_data`, `qcsv.map_columns`,
+    `qcsv.convert_missing_cells` and `qcsv.collect`, when it is given as
+    their `stats` argument. Any other code can be measured with
+    `qcsv.Stats.stage`.
+
+    The stages of `qcsv.read` are `load` (parsing, type inference and
+    casting, which are fused into one pass), `columnar`, `categorize`
+    and `cache`.
+
+    If `progress` is set, it is called with the stage name, the number
+    of rows loaded so far and the seconds elapsed, once every `every`
+    rows while a file is loaded. If `memory` is set, the peak memory
+    allocated by each stage is measured with `tracemalloc`, which slows
+    everything down.
+
+    When no `Stats` is given, nothing is measured and nothing is called.
+    """
+    def __init__(self, progress=None, every=100000, memory=False):
+        assert not memory or tracemalloc is not None, \
+            'Measuring memory requires tracemalloc'
+        self.stages = []
+        self.progress = progress
+        self.every = every
+        self.memory = memory
+        self._open = []
+        self._tracing = False
+
+    def start(self, name):
+        """
+        `start` begins a stage called `name`. Stages may be nested.
+        """
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing = True
+            self._peak()
+        self._open.append([name, time.time(), 0])
+
+    def stop(self, rows=None, nbytes=None):
+        """
+        `stop` ends the most recently started stage, and records it
+        along with the given number of rows and bytes.
+        """
+        if self.memory:
+            self._peak()
+        name, start, peak = self._open.pop()
+        self.stages.append(Stage(name=name, seconds=time.time() - start,
+                                 rows=rows, bytes=nbytes,
+                                 peak_bytes=peak if self.memory else None))
+        if self._tracing and len(self._open) == 0:
+            tracemalloc.stop()
+            self._tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        `stage` is a context manager that records the code it wraps as a
+        stage called `name`.
+        """
+        self.start(name)
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    def track(self, rows):
+        """
+        `track` returns an iterator over `rows` that reports progress
+        for the current stage.
+        """
+        if self.progress is None:
+            return rows
+        return self._track(rows)
+
+    def report(self):
+        """
+        `report` returns a table of the recorded stages and their
+        throughput as a string.
+        """
+        lines = ['%-21s %9s %10s %12s %9s %9s'
+                 % ('stage', 'seconds', 'rows', 'rows/s', 'MB/s', 'peak MB')]
+        for s in self.stages:
+            secs = max(s.seconds, 1e-9)
+            lines.append('%-21s %9.3f %10s %12s %9s %9s' % (
+                s.name, s.seconds, '-' if s.rows is None else s.rows,
+                '-' if s.rows is None else '%.0f' % (s.rows / secs),
+                '-' if s.bytes is None else '%.1f' % (s.bytes / secs / 2**20),
+                '-' if s.peak_bytes is None
+                else '%.1f' % (s.peak_bytes / 2**20)))
+        return '\n'.join(lines)
+
+    def _track(self, rows):
+        name, start = self._open[-1][:2]
+        progress, every = self.progress, self.every
+        n = 0
+        for row in rows:
+            yield row
+            n += 1
+            if n % every == 0:
+                progress(name, n, time.time() - start)
+
+    def _peak(self):
+        # Fold the peak since the last check into every open stage, so
+        # an outer stage's peak includes those of its inner stages.
+        peak = tracemalloc.get_traced_memory()[1]
+        for s in self._open:
+            s[2] = max(s[2], peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+
+class _NoStats(object):
+    """
+    `_NoStats` stands in for a `qcsv.Stats` when none is given.
+    """
+    def start(self, name):
+        pass
+
+    def stop(self, rows=None, nbytes=None):
+        pass
+
+    def track(self, rows):
+        return rows
+
+
+_nostats = _NoStats()
+
+_dtypes = {int: np.int64, float: np.float64}
+_fills = {int: 0, float: 0.0}
+
 try:
     text_type = basestring
 except NameError:
     text_type = str
 
 
-def read(fname, delimiter=',', skip_header=False):
+def read(fname, delimiter=',', skip_header=False, columnar=False,
+         sample=None, sampling='head', strict=False, processes=None,
+         memory_map=False, cache=None, usecols=None, where=None,
+         categorical=None, stats=None):
     """
     `read` loads cell data, column headers and type information
     for each column given a file path to a CSV formatted file. A
     `qcsv.Table` namedtuple is returned with fields `qcsv.Table.types`,
     `qcsv.Table.names` and `qcsv.Table.rows`.
 
+    `fname` may also be a file object opened in text or binary mode,
+    which is read from its current position. Files compressed with
+    gzip, bzip2 or xz are detected by their first bytes and decompressed
+    as they are read, on a background thread.
+
     All cells have left and right whitespace trimmed.
 
     All rows **must** be the same length.
@@ -62,14 +384,675 @@ def read(fname, delimiter=',', skip_header=False):
 
     If `skip_header` is set, then no column headers are read, and
     column names are set to their corresponding indices (as strings).
+
+    If `columnar` is set, then a `qcsv.ColumnTable` is returned instead
+    of a `qcsv.Table`.
+
+    If `usecols` is set, only the columns it lists are loaded, in the
+    order given. Columns may be given by name (ignoring case) or by
+    index. Other cells are dropped as soon as a row is split into
+    fields, so they are never trimmed, type inferred, cast or stored.
+
+    If `where` is set, only rows that pass its filters are loaded.
+    Filters are checked as soon as a row is split into fields, so
+    rejected rows are never cast or stored. `where` is a filter or a
+    list of filters that must all pass. A filter is either a function
+    that is given a list of every trimmed cell in a row (as strings),
+    or a tuple `(column, op, value)`, where `op` is one of `==`, `!=`,
+    `<`, `<=`, `>`, `>=` or `in`. The cell is converted to a number
+    before it's compared with a number `value`. (Cells that aren't
+    numbers never pass such comparisons.) Empty cells only match a
+    `value` of `None`. Filters may refer to columns that aren't in
+    `usecols`.
+
+    The file is parsed, type inferred and cast in a single pass (see
+    `qcsv._Loader`), which gives the same result as calling
+    `qcsv._data`, `qcsv._column_types` and `qcsv.cast` in turn. If
+    `sample` is set to a number of rows, then types are also inferred
+    from only that many rows. When `sampling` is `head`, the first rows
+    are used, and loading starts with their types. When it is
+    `reservoir`, a uniform random sample of rows is used. Cells outside
+    the sample that don't fit their column's type promote the column
+    type as usual, so the table is the same as without a sample, and
+    it isn't faster to load. A sample is only useful with `strict`, in
+    which case a `ValueError` is raised if any column's type differs
+    from the one inferred from the sample.
+
+    If `processes` is greater than one, the file is split into that many
+    chunks that are parsed, type inferred and cast in parallel by a pool
+    of processes. The result is the same as loading the file in one
+    process, provided that quote characters only appear inside of
+    quoted fields. This cannot be combined with `sample`.
+
+    If `memory_map` is set, the file is memory mapped and numbers are
+    parsed directly from its bytes, so only cells that are kept as
+    strings are ever decoded. This is experimental: it is usually
+    slower than the default, since records are split by Python code
+    rather than by the `csv` module, and it doesn't use less memory.
+    The file's encoding must be a superset of ASCII. This cannot be
+    combined with `sample` or `processes`.
+
+    If `cache` is set, the typed table is saved in a binary format
+    the first time the file is read, and loaded from there on later
+    reads with the same options, as long as the file's size and
+    modification time haven't changed. When `cache` is `True`, the cache
+    is kept in a hidden directory next to the file. Otherwise, `cache`
+    is the path of a directory to keep it in. Columns are memory mapped
+    when loaded from the cache, so this is fastest when `columnar` is
+    set. Functions in `where` can't be told apart reliably, so a read
+    with a function filter is never cached.
+
+    If `categorical` is set, then `str` columns are dictionary encoded
+    as described in `qcsv.categorize`, where `categorical` is either a
+    list of column names or `True` to pick columns automatically. This
+    requires `columnar`.
+
+    If `stats` is a `qcsv.Stats`, the time spent in each stage of
+    loading is recorded in it, and progress is reported to its callback.
+    """
+    assert sampling in ('head', 'reservoir'), \
+        'Unknown sampling method %s' % sampling
+    assert processes is None or sample is None, \
+        'Sampled type inference cannot be done in parallel'
+    assert not memory_map or (sample is None and processes is None), \
+        'Memory mapping cannot be combined with sample or processes'
+    assert not categorical or columnar, \
+        'Categorical columns require columnar'
+    assert not (memory_map or (processes or 0) > 1) or _plain(fname), \
+        'memory_map and processes require the path of an uncompressed file'
+    assert not cache or not hasattr(fname, 'read'), \
+        'Only files given by path can be cached'
+    if stats is None:
+        stats = _nostats
+    if any(callable(w) for w in _filters(where)):
+        cache = None
+
+    if cache:
+        path = _cache_path(fname, cache, (delimiter, skip_header, sample,
+                                          sampling, strict, usecols,
+                                          where, categorical))
+        if os.path.isdir(path):
+            stats.start('cache')
+            table = _load_cache(path)
+            table = table if columnar else to_rows(table)
+            stats.stop(rows=_nrows(table))
+            return table
+
+    table = _read(fname, delimiter, skip_header, usecols, where, sample,
+                  sampling, strict, processes, memory_map, stats)
+    if columnar:
+        stats.start('columnar')
+        table = _take_columns(table)
+        stats.stop(rows=_nrows(table))
+    if categorical:
+        stats.start('categorize')
+        table = categorize(table,
+                           None if categorical is True else categorical)
+        stats.stop(rows=_nrows(table))
+    if cache:
+        stats.start('cache')
+        _save_cache(path, to_columnar(table))
+        stats.stop(rows=_nrows(table))
+    return table
+
+
+def _read(fname, delimiter, skip_header, usecols, where, sample, sampling,
+          strict, processes, memory_map, stats):
+    """
+    `_read` loads a `qcsv.Table` from a file as described in
+    `qcsv.read`, recording its stages in `stats`.
+    """
+    size = None if hasattr(fname, 'read') else os.path.getsize(fname)
+    if memory_map:
+        stats.start('load')
+        # On Python 2, cells are kept as bytes, as the csv module reads
+        # them.
+        encoding = None
+        if text_type is str:
+            encoding = locale.getpreferredencoding(False)
+        names, rows = _mmap_reader(fname, delimiter, skip_header, usecols,
+                                   where, encoding)
+        loader = _Loader(len(names))
+        loader.feed_bytes(stats.track(rows), encoding)
+        table = loader.table(names)
+        stats.stop(rows=len(table.rows), nbytes=size)
+        return table
+    if processes is not None and processes > 1:
+        stats.start('load')
+        table = _read_parallel(fname, delimiter, skip_header, usecols,
+                               where, processes)
+        stats.stop(rows=len(table.rows), nbytes=size)
+        return table
+    stats.start('load')
+    names, rows = _reader(fname, delimiter, skip_header, usecols, where)
+    rows = stats.track(rows)
+    loader = _Loader(len(names))
+    if sample is None:
+        loader.feed(rows)
+    elif sampling == 'head':
+        head = list(itertools.islice(rows, sample))
+        types = _column_types(names, head)
+        loader.types[:] = [types[name] for name in names]
+        loader.feed(itertools.chain(head, rows))
+    else:
+        reservoir = []
+        loader.feed(_reservoir(rows, sample, reservoir))
+        types = _column_types(names, reservoir)
+    table = loader.table(names)
+    stats.stop(rows=len(table.rows), nbytes=size)
+    if sample is not None and strict and table.types != types:
+        changed = [name for name in names if table.types[name] != types[name]]
+        raise ValueError('Column %s was inferred to have type %s from a '
+                         'sample of %d rows, but has type %s'
+                         % (changed[0], type_str(types[changed[0]]), sample,
+                            type_str(table.types[changed[0]])))
+    return table
+
+
+def _reservoir(rows, k, sample):
+    """
+    `_reservoir` yields each row from the iterator `rows`, while keeping
+    a copy of a uniform random sample of at most `k` of the rows in the
+    list `sample`.
+    """
+    for i, row in enumerate(rows):
+        if i < k:
+            sample.append(list(row))
+        else:
+            j = int(random.random() * (i + 1))
+            if j < k:
+                sample[j] = list(row)
+        yield row
+
+
+def _cache_path(fname, cache, options):
+    """
+    `_cache_path` returns the path of the cache directory for reading
+    `fname` with the given options. The path depends on the file's
+    absolute path, size and modification time.
+    """
+    fname = os.path.abspath(fname)
+    st = os.stat(fname)
+    version = _cache_key((fname, st.st_size, st.st_mtime))
+    if cache is True:
+        cache = os.path.dirname(fname)
+    return os.path.join(cache, '.%s.%s.%s.qcsv' % (
+        os.path.basename(fname), version, _cache_key(options)))
+
+
+def _cache_key(value):
+    """
+    `_cache_key` returns a short hash of `repr(value)`.
+    """
+    return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()[:16]
+
+
+def _save_cache(path, table):
+    """
+    `_save_cache` writes a `qcsv.ColumnTable` to the cache directory
+    `path`. Each column is saved as a NumPy array, along with its mask
+    if it has one. The directory is written under a temporary name and
+    then renamed, so a partially written cache is never read. Entries
+    for older versions of the same file are removed.
+    """
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    tmp = tempfile.mkdtemp(dir=parent)
+    masked, categorical = [], []
+    for c, col in enumerate(table.columns):
+        categorical.append(isinstance(col, Categorical))
+        if categorical[-1]:
+            _save_array(os.path.join(tmp, '%d.categories' % c),
+                        col.categories)
+            col = col.codes
+        _save_array(os.path.join(tmp, '%d' % c), col.data)
+        masked.append(np.ma.getmask(col) is not np.ma.nomask)
+        if masked[-1]:
+            np.save(os.path.join(tmp, '%d.mask.npy' % c), col.mask)
+    meta = {
+        'names': table.names,
+        'types': [type_str(table.types[name]) for name in table.names],
+        'masked': masked,
+        'categorical': categorical,
+    }
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # Someone else wrote the same cache first.
+        shutil.rmtree(tmp, ignore_errors=True)
+    _remove_stale_caches(path)
+
+
+def _remove_stale_caches(path):
+    """
+    `_remove_stale_caches` removes the cache directories next to `path`
+    for the same file but a different size or modification time.
+    Entries for the current version of the file with other options are
+    kept.
+    """
+    parent, name = os.path.split(path)
+    prefix, version, _, _ = name.rsplit('.', 3)
+    for sibling in os.listdir(parent):
+        if not sibling.startswith(prefix + '.') \
+                or not sibling.endswith('.qcsv'):
+            continue
+        parts = sibling[len(prefix) + 1:].split('.')
+        if len(parts) == 3 and parts[0] != version:
+            shutil.rmtree(os.path.join(parent, sibling), ignore_errors=True)
+
+
+def _save_array(prefix, data):
+    """
+    `_save_array` saves `data` to `prefix.npy`. Arrays of Python objects
+    (strings, and integers too big for `int64`) are saved as their
+    UTF-8 encoded text in `prefix.text.npy` with the end offset of each
+    cell in `prefix.offsets.npy`, so that a cache never holds pickles.
+    """
+    if data.dtype.kind != 'O':
+        np.save(prefix + '.npy', data)
+        return
+    cells = [b'' if x is None else
+             (x if isinstance(x, text_type) else '%d' % x).encode(
+                 'utf-8', 'surrogatepass')
+             for x in data]
+    offsets = np.cumsum([len(x) for x in cells], dtype=np.int64)
+    np.save(prefix + '.text.npy', np.frombuffer(b''.join(cells), np.uint8))
+    np.save(prefix + '.offsets.npy', offsets)
+
+
+def _load_cache(path):
+    """
+    `_load_cache` reads a `qcsv.ColumnTable` written by
+    `qcsv._save_cache`. Arrays are memory mapped, except for columns of
+    Python objects, which are decoded into memory.
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    types = {'None': None, 'int': int, 'float': float, 'str': str}
+    cols = []
+    for c, masked in enumerate(meta['masked']):
+        mask = np.ma.nomask
+        if masked:
+            mask = np.load(os.path.join(path, '%d.mask.npy' % c),
+                           mmap_mode='r')
+        data = _load_array(os.path.join(path, '%d' % c),
+                           types[meta['types'][c]], mask)
+        cols.append(np.ma.array(data, mask=mask, copy=False))
+        if meta['categorical'][c]:
+            cats = _load_array(os.path.join(path, '%d.categories' % c), str)
+            cols[-1] = Categorical(codes=cols[-1], categories=cats)
+    return ColumnTable(types=dict((name, types[typ]) for name, typ
+                                  in zip(meta['names'], meta['types'])),
+                       names=meta['names'], columns=cols)
+
+
+def _load_array(prefix, typ, mask=np.ma.nomask):
+    """
+    `_load_array` loads an array saved by `qcsv._save_array`. NumPy
+    arrays are memory mapped. Cells of a column of Python objects are
+    converted back with `typ`, except for those in `mask`, which are
+    `None`.
+    """
+    if os.path.exists(prefix + '.npy'):
+        return np.load(prefix + '.npy', mmap_mode='r')
+    text = np.load(prefix + '.text.npy').tobytes()
+    offsets = np.load(prefix + '.offsets.npy').tolist()
+    nulls = np.ma.make_mask_none(len(offsets)) | mask
+    data = np.empty(len(offsets), dtype=object)
+    data[:] = [None if null else
+               typ(text[start:end].decode('utf-8', 'surrogatepass'))
+               for null, start, end in zip(nulls, [0] + offsets, offsets)]
+    return data
+
+
+def lazy(table):
+    """
+    `lazy` returns a `qcsv.LazyTable` for `table`. `qcsv.map_names`,
+    `qcsv.cast`, `qcsv.convert_missing_cells`, `qcsv.convert_columns`
+    and `qcsv.convert_types` only record what they would do to a
+    `qcsv.LazyTable`. The recorded operations on each column are fused
+    into one function, which is only executed by `qcsv.collect`. So a
+    chain of conversions costs one pass over the columns it affects.
+
+    Functions that need the data, like `qcsv.column` or
+    `qcsv.print_data_table`, call `qcsv.collect` themselves.
+    """
+    if isinstance(table, LazyTable):
+        return table
+    return LazyTable(types=table.types, names=table.names, table=table,
+                     ops=((),) * len(table.names))
+
+
+def collect(table, stats=None):
+    """
+    `collect` executes the pending operations of a `qcsv.LazyTable`, and
+    returns the resulting table. Any other table is returned as is.
+
+    If `stats` is a `qcsv.Stats`, the work is recorded in it as a stage.
+    """
+    if not isinstance(table, LazyTable):
+        return table
+    if stats is not None:
+        return _staged(stats, 'collect', collect, table)
+    fs = {}
+    for c, ops in enumerate(table.ops):
+        if len(ops) > 0:
+            fs[c] = functools.partial(_convert_cells, _compose(ops))
+    return _map_columns(table.table, fs)._replace(types=table.types,
+                                                  names=table.names)
+
+
+def _staged(stats, name, f, table, *args):
     """
-    names, rows = _data(fname, delimiter, skip_header)
-    types = _column_types(names, rows)
+    `_staged` returns `f(table, *args)`, recording it in `stats` as a
+    stage called `name`.
+    """
+    stats.start(name)
+    table = f(table, *args)
+    stats.stop(rows=_nrows(table))
+    return table
+
+
+def _nrows(table):
+    """
+    `_nrows` returns the number of rows in `table`, or `None` if its rows
+    are an iterator.
+    """
+    if isinstance(table, ColumnTable):
+        return len(table.columns[0]) if len(table.columns) > 0 else 0
+    if isinstance(table, Table) and isinstance(table.rows, list):
+        return len(table.rows)
+    return None
+
+
+def _record(table, fs):
+    """
+    `_record` adds the cell functions in `fs`, a dictionary from column
+    index to function, to the pending operations of a `qcsv.LazyTable`.
+    """
+    ops = list(table.ops)
+    for c, f in fs.items():
+        ops[c] = ops[c] + (f,)
+    return table._replace(ops=tuple(ops))
+
+
+def _compose(fs):
+    """
+    `_compose` returns a function of one cell that applies each function
+    in `fs` in turn.
+    """
+    if len(fs) == 1:
+        return fs[0]
+
+    def f(cell):
+        for g in fs:
+            cell = g(cell)
+        return cell
+    return f
+
+
+def to_columnar(table):
+    """
+    `to_columnar` converts a `qcsv.Table` to a `qcsv.ColumnTable`. The
+    cells of `table` should already be cast (see `qcsv.cast`).
+
+    If `table` is already a `qcsv.ColumnTable`, it is returned as is.
+    """
+    table = collect(table)
+    if isinstance(table, ColumnTable):
+        return table
+    # One column at a time, so that only one list of cells is built at
+    # once.
+    return ColumnTable(types=table.types, names=table.names,
+                       columns=[_array(table.types[name],
+                                       list(map(itemgetter(c), table.rows)))
+                                for c, name in enumerate(table.names)])
+
+
+def _take_columns(table):
+    """
+    `_take_columns` is like `qcsv.to_columnar`, except that it empties
+    the rows of `table` as it goes, so the cells of each column are
+    freed from the rows as soon as its array is built. It must only be
+    used on a table that nothing else refers to.
+    """
+    rows = table.rows
+    cols = [None] * len(table.names)
+    for c in reversed(range(len(table.names))):
+        cols[c] = _array(table.types[table.names[c]],
+                         [row.pop() for row in rows])
+    del rows[:]
+    return ColumnTable(types=table.types, names=table.names, columns=cols)
+
 
-    return cast(Table(types=types, names=names, rows=rows))
+def to_rows(table):
+    """
+    `to_rows` converts a `qcsv.ColumnTable` to a `qcsv.Table`, where
+    masked cells become `None`.
+
+    If `table` is already a `qcsv.Table`, it is returned as is.
+    """
+    table = collect(table)
+    if not isinstance(table, ColumnTable):
+        return table
+    rows = []
+    if len(table.columns) > 0:
+        rows = list(map(list, zip(*[col.tolist() for col in table.columns])))
+    return Table(types=table.types, names=table.names, rows=rows)
+
+
+def _array(typ, cells):
+    """
+    `_array` builds a column for a `qcsv.ColumnTable` out of a list of
+    cells with type `typ`. `None` cells are masked. Columns that aren't
+    `int` or `float` are arrays of Python objects.
+    """
+    mask = np.array([cell is None for cell in cells], dtype=bool)
+    data = None
+    if typ in _dtypes:
+        if len(cells) == 0:
+            data = np.array([], dtype=_dtypes[typ])
+        else:
+            filled = cells
+            if mask.any():
+                filled = [_fills[typ] if cell is None else cell
+                          for cell in cells]
+            data = np.array(filled)
+            # Reject anything NumPy couldn't represent with the expected
+            # kind of array, e.g., big integers or a mix of ints and strs.
+            if data.dtype.kind != np.dtype(_dtypes[typ]).kind:
+                data = None
+    if data is None:
+        data = np.empty(len(cells), dtype=object)
+        data[:] = cells
+    return np.ma.array(data, mask=mask if mask.any() else np.ma.nomask)
+
+
+def categorize(table, colnames=None):
+    """
+    `categorize` returns a `qcsv.ColumnTable` where the `str` columns
+    named in `colnames` are dictionary encoded as `qcsv.Categorical`
+    columns. If `colnames` is `None`, then every `str` column where
+    fewer than half of the cells are distinct is encoded.
+
+    Converters from `qcsv.convert_columns` and `qcsv.convert_types` are
+    executed once for each distinct value of a categorical column, and
+    `qcsv.frequencies` counts its codes instead of its cells.
+    """
+    table = to_columnar(table)
+    if colnames is not None:
+        colnames = set(table.column_index(name) for name in colnames)
+    new_cols = list(table.columns)
+    for c, name in enumerate(table.names):
+        col = table.columns[c]
+        if isinstance(col, Categorical) or table.types[name] is not str:
+            continue
+        if colnames is not None and c not in colnames:
+            continue
+        encoded = _encode(col.tolist())
+        if colnames is None and len(encoded.categories) * 2 >= len(col):
+            continue
+        new_cols[c] = encoded
+    return table._replace(columns=new_cols)
+
+
+def _encode(cells):
+    """
+    `_encode` dictionary encodes a list of cells as a
+    `qcsv.Categorical`. `None` cells are masked.
+    """
+    index = {None: -1}
+    codes = np.fromiter((index.setdefault(cell, len(index) - 1)
+                         for cell in cells),
+                        dtype=np.int32, count=len(cells))
+    mask = codes < 0
+    codes[mask] = 0
+    del index[None]
+    categories = [None] * len(index)
+    for cell, code in index.items():
+        categories[code] = cell
+    return Categorical(
+        codes=np.ma.array(codes, mask=mask if mask.any() else np.ma.nomask),
+        categories=_array(str, categories).data)
+
+
+def write(table, fname, delimiter=',', null='', header=True,
+          compression=None, size=10000):
+    """
+    `write` writes `table` as CSV data to `fname`, which is a path or a
+    text file object, with a header row of column names unless `header`
+    is false. Cells are quoted only when they need to be, and `None`
+    cells are written as `null`.
+
+    If `compression` is `gz`, `bz2` or `xz`, the output is compressed
+    (and `fname` may be a binary file object). For a path, it defaults
+    to the one named by the file's extension, if any.
+
+    Rows are written in batches of `size` rows by Python's `csv` module,
+    which formats numbers itself, so a `qcsv.ColumnTable` or a streamed
+    table (see `qcsv.stream`) is never converted all at once.
+
+    A table read with `qcsv.read` is written so that reading the output
+    gives the same table, since floats are written with `repr` and NULLs
+    are empty by default. Cells that `qcsv.read` would change are the
+    exception: strings with whitespace at either end are trimmed, empty
+    strings become NULL and a `str` column that only has numbers reads
+    back as numbers.
+    """
+    table = collect(table)
+    if compression is None and not hasattr(fname, 'write'):
+        compression = {'.gz': 'gz', '.bz2': 'bz2',
+                       '.xz': 'xz'}.get(os.path.splitext(fname)[1])
+    if compression is not None:
+        assert compression != 'xz' or lzma is not None, \
+            'Writing xz files requires the lzma module'
+        f = _compress(fname, compression)
+    elif hasattr(fname, 'write'):
+        f = fname
+    else:
+        f = open(fname, 'wb')
+    if f is not fname and text_type is str:
+        # Python 3's csv module writes text, while Python 2's writes
+        # bytes to a file opened in binary mode.
+        f = io.TextIOWrapper(f, encoding=locale.getpreferredencoding(False),
+                             newline='')
+    try:
+        w = csv.writer(f, delimiter=delimiter, lineterminator='\n')
+        if header:
+            w.writerow(table.names)
+        for rows in _written_rows(table, size):
+            if null != '':
+                # The csv module writes None as an empty string.
+                rows = [[null if cell is None else cell for cell in row]
+                        for row in rows]
+            w.writerows(rows)
+    finally:
+        if f is not fname:
+            f.close()
+
+
+def _compress(fname, compression):
+    """
+    `_compress` returns a binary file object that writes to `fname`, a
+    path or a binary file object, compressed with `compression`.
+    """
+    if compression == 'gz':
+        # The same level as the gzip command, which is much faster than
+        # the default of 9.
+        if hasattr(fname, 'write'):
+            return gzip.GzipFile(fileobj=fname, mode='wb', compresslevel=6)
+        return gzip.GzipFile(fname, 'wb', compresslevel=6)
+    elif compression == 'bz2':
+        return bz2.BZ2File(fname, 'wb')
+    return lzma.LZMAFile(fname, 'wb')
+
+
+def _written_rows(table, size):
+    """
+    `_written_rows` returns an iterator over lists of at most `size` rows
+    of `table` for `qcsv.write`.
+    """
+    if isinstance(table, ColumnTable):
+        n = _nrows(table)
+        return (_row_slice(table, a, a + size) for a in range(0, n, size))
+    if isinstance(table.rows, list):
+        return iter([table.rows])
+    return (batch.rows for batch in batches(table, size))
+
+
+def stream(fname, delimiter=',', skip_header=False, types=None,
+           window=1000, usecols=None, where=None):
+    """
+    `stream` is like `qcsv.read`, except rows are parsed and type cast
+    lazily. A `qcsv.Table` is returned whose `qcsv.Table.rows` is an
+    iterator of typed rows rather than a list, so memory use stays
+    bounded no matter how large the file is.
+
+    Since the entire file is never in memory, types are inferred from
+    only the first `window` rows. Any entries in `types`, a dictionary
+    mapping column names (ignoring case) to types, take precedence over
+    inferred types. (So if every column is given a type, no inference
+    is necessary.) If a later cell cannot be cast to its column's type,
+    a `ValueError` is raised when that row is reached. This includes a
+    column that is empty in the first `window` rows, which has type
+    `None`, so give sparse columns a type in `types`.
+
+    `fname`, `delimiter`, `skip_header`, `usecols` and `where` are
+    described in `qcsv.read`.
+
+    Use `qcsv.batches` to consume the rows in fixed size chunks.
+    """
+    names, rows = _reader(fname, delimiter, skip_header, usecols, where)
+    head = list(itertools.islice(rows, window))
+    inferred = _column_types(names, head)
+    index = _name_index(names)
+    for name, typ in (types or {}).items():
+        assert name.lower() in index, 'Column name %s does not exist' % name
+        inferred[names[index[name.lower()]]] = typ
+    return Table(types=inferred, names=names,
+                 rows=_cast_rows(inferred, names,
+                                 itertools.chain(head, rows)))
+
+
+def batches(table, size=10000):
+    """
+    `batches` splits `table` into a sequence of tables with at most
+    `size` rows each. This is most useful with tables returned by
+    `qcsv.stream`, since only one batch is in memory at a time.
+    """
+    rows = iter(table.rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if len(batch) == 0:
+            break
+        yield table._replace(rows=batch)
 
 
-def _data(fname, delimiter=',', skip_header=False):
+def _data(fname, delimiter=',', skip_header=False, usecols=None,
+          where=None):
     """
     `_data` loads cell data and column headers, and returns the names
     and rows.
@@ -78,27 +1061,1017 @@ def _data(fname, delimiter=',', skip_header=False):
 
     All rows MUST be the same length.
 
-    `delimiter` and `skip_header` are described in `qcsv.read`.
+    `delimiter`, `skip_header`, `usecols` and `where` are described
+    in `qcsv.read`.
+    """
+    names, rows = _reader(fname, delimiter, skip_header, usecols, where)
+    return names, list(rows)
+
+
+def _reader(fname, delimiter=',', skip_header=False, usecols=None,
+            where=None):
     """
+    `_reader` is the lazy version of `qcsv._data`. The column names are
+    read immediately, but rows are returned as an iterator. The file is
+    closed once the iterator is exhausted, unless it was given as a file
+    object.
+    """
+    f = _open(fname)
+    reader = csv.reader(f, delimiter=delimiter)
     names = []
-    rows = []
-    reader = csv.reader(open(fname), delimiter=delimiter)
     if not skip_header:
-        names = list(map(str.strip, next(reader)))
+        names = list(map(str.strip, next(reader, [])))
+
+    # If we aren't discovering names from column headers, then we need to
+    # peek at the first row to find out how many columns there are.
+    first = []
+    if len(names) == 0:
+        first = list(itertools.islice(reader, 1))
+        if len(first) > 0:
+            # Name the columns "0", "1", ..., "n-1" where "n" is the number
+            # of columns in the first row.
+            names = list(map(str, range(0, len(first[0]))))
+
+    select = _select(names, usecols)
+    keep = _predicate(names, where)
+
+    def rows():
+        try:
+            for row in _strip_rows(itertools.chain(first, reader),
+                                   len(names), select, keep):
+                yield row
+        finally:
+            if f is not fname:
+                f.close()
+    return _selected(names, select), rows()
+
+
+# The magic numbers of compressed files. A bzip2 file starts with `BZh`,
+# a block size from 1 to 9 and then the magic number of its first block.
+_magic = [(re.compile(b'\x1f\x8b'), 'gz'),
+          (re.compile(b'BZh[1-9]1AY&SY'), 'bz2'),
+          (re.compile(b'\xfd7zXZ\x00'), 'xz')]
+_magic_size = 10
+
+
+def _open(fname):
+    """
+    `_open` returns a text file for reading the rows of `fname`, which is
+    a path or a file object, as described in `qcsv.read`. Compressed
+    files are decompressed on a background thread (see
+    `qcsv._Prefetch`). A text file object is returned as is. On Python
+    2, whose `csv` module reads bytes, a binary file object is returned
+    instead.
+    """
+    if hasattr(fname, 'read'):
+        if not isinstance(fname.read(0), bytes):
+            return fname
+        f = io.BufferedReader(_RawStream(fname))
+        compression = _compression(f.peek(_magic_size)[:_magic_size])
+    else:
+        with open(fname, 'rb') as f:
+            compression = _compression(f.read(_magic_size))
+        if compression is None:
+            return open(fname)
+        f = fname
+    if compression is not None:
+        assert compression != 'xz' or lzma is not None, \
+            'Reading xz files requires the lzma module'
+        f = io.BufferedReader(_Prefetch(_decompress(f, compression)))
+    if text_type is not str:
+        return f
+    return io.TextIOWrapper(f, encoding=locale.getpreferredencoding(False))
+
+
+def _compression(magic):
+    """
+    `_compression` returns the compression format of a file that starts
+    with the bytes `magic`, or `None` if it isn't compressed.
+    """
+    for pattern, compression in _magic:
+        if pattern.match(magic):
+            return compression
+    return None
+
+
+def _decompress(f, compression):
+    """
+    `_decompress` returns a binary file object with the decompressed
+    contents of `f`, a path or a binary file object compressed with
+    `compression`. Only the module for `compression` is used.
+    """
+    if compression == 'xz':
+        return lzma.open(f, 'rb')
+    if text_type is str:
+        return (gzip.open if compression == 'gz' else bz2.open)(f, 'rb')
+    if compression == 'gz':
+        new = functools.partial(zlib.decompressobj, 16 + zlib.MAX_WBITS)
+    else:
+        new = bz2.BZ2Decompressor
+    if hasattr(f, 'read'):
+        return _Decompress(f, new)
+    return _Decompress(open(f, 'rb'), new, owned=True)
+
+
+def _plain(fname):
+    """
+    `_plain` returns whether `fname` is the path of an uncompressed file,
+    which can be memory mapped or split into chunks.
+    """
+    if hasattr(fname, 'read'):
+        return False
+    with open(fname, 'rb') as f:
+        return _compression(f.read(_magic_size)) is None
+
+
+class _RawStream(io.RawIOBase):
+    """
+    `_RawStream` adapts a binary file object given to `qcsv.read` so that
+    it can be buffered. Closing it leaves the file object open.
+    """
+    def __init__(self, f):
+        self._f = f
+
+    def readable(self):
+        return True
 
+    def readinto(self, b):
+        data = self._f.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class _Decompress(io.RawIOBase):
+    """
+    `_Decompress` decompresses the data read from the binary file object
+    `f` with decompressors made by calling `new`, starting a new one
+    after each stream ends. It's used on Python 2, whose `gzip` module
+    can't read a file object that isn't seekable and whose `bz2` module
+    can't read a file object or more than one stream. Closing it closes
+    `f` only if `owned` is set.
+    """
+    def __init__(self, f, new, owned=False, size=1 << 16):
+        self._f = f
+        self._new = new
+        self._owned = owned
+        self._size = size
+        self._z = new()
+        self._data = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self._data) == 0:
+            chunk = self._f.read(self._size)
+            if len(chunk) == 0:
+                return 0
+            out = []
+            while len(chunk) > 0:
+                try:
+                    out.append(self._z.decompress(chunk))
+                except EOFError:
+                    # The last stream ended exactly at the end of the
+                    # previous chunk.
+                    self._z = self._new()
+                    continue
+                chunk = self._z.unused_data
+                if len(chunk) > 0:
+                    self._z = self._new()
+            self._data = b''.join(out)
+        n = min(len(b), len(self._data))
+        b[:n] = self._data[:n]
+        self._data = self._data[n:]
+        return n
+
+    def close(self):
+        if not self.closed and self._owned:
+            self._f.close()
+        io.RawIOBase.close(self)
+
+
+class _Prefetch(io.RawIOBase):
+    """
+    `_Prefetch` reads chunks of `size` bytes from the file object `f` on a
+    background thread, at most `depth` chunks ahead of the reader. For a
+    compressed file, this lets decompression (which releases the GIL)
+    overlap with parsing. Closing it stops the thread and closes `f`.
+    """
+    def __init__(self, f, size=1 << 20, depth=4):
+        self._f = f
+        self._chunks = queue.Queue(depth)
+        self._chunk = memoryview(b'')
+        self._eof = False
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(size,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if len(self._chunk) == 0:
+            if self._eof:
+                return 0
+            chunk = self._chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if len(chunk) == 0:
+                self._eof = True
+                return 0
+            self._chunk = memoryview(chunk)
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._done.set()
+            self._thread.join()
+            self._f.close()
+        io.RawIOBase.close(self)
+
+    def _run(self, size):
+        try:
+            while not self._done.is_set():
+                chunk = self._f.read(size)
+                self._put(chunk)
+                if len(chunk) == 0:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        # Give up if the reader is closed while the queue is full.
+        while not self._done.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+
+def _strip_rows(reader, ncols, select=None, keep=None):
+    """
+    `_strip_rows` trims every cell of each row from `reader`, and checks
+    that each row has `ncols` cells. If `select` is a list of column
+    indices, only those cells are kept (and trimmed). If `keep` is a
+    predicate from `qcsv._predicate`, rows it rejects are skipped.
+    """
+    project = _projector(select)
     for i, row in enumerate(reader):
-        # If we haven't discovered names from column headers, then name the
-        # columns "0", "1", ..., "n-1" where "n" is the number of columns in
-        # the first row.
-        if len(names) == 0:
-            names = list(map(str, range(0, len(row))))
-        assert len(row) == len(names), \
+        assert len(row) == ncols, \
             'The length of row %d is %d, but others rows have length %d' \
-            % (i, len(row), len(names))
+            % (i, len(row), ncols)
+        if keep is not None and not keep(row):
+            continue
+        if project is not None:
+            row = project(row)
+        yield list(map(str.strip, row))
+
+
+_ops = {
+    '==': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le,
+    '>': operator.gt, '>=': operator.ge,
+    'in': lambda cell, values: cell in values,
+}
 
-        rows.append(list(map(str.strip, row)))
 
-    return names, rows
+def _predicate(names, where, text=None):
+    """
+    `_predicate` returns a function that tells whether to keep a row of
+    untrimmed cells according to the filters in `where`, as described
+    in `qcsv.read`, or `None` if there are no filters. If `text` is
+    given, it is used to turn each cell into a string first.
+    """
+    if where is None:
+        return None
+    where = _filters(where)
+    index = _name_index(names)
+
+    def cell(row, i):
+        return (row[i] if text is None else text(row[i])).strip()
+
+    def raw(f, row):
+        return f([cell(row, i) for i in range(len(row))])
+
+    def compare(i, op, value, row):
+        s = cell(row, i)
+        if len(s) == 0:
+            return value is None and op in ('==', 'in')
+        elif value is None:
+            return op == '!='
+        if op == 'in':
+            return s in value or _cell_value(s) in value
+        if not isinstance(value, text_type):
+            s = _cell_value(s)
+            if isinstance(s, text_type):
+                return False
+        return _ops[op](s, value)
+
+    checks = []
+    for w in where:
+        if callable(w):
+            checks.append(functools.partial(raw, w))
+            continue
+        name, op, value = w
+        assert name.lower() in index, 'Column name %s does not exist' % name
+        assert op in _ops, 'Unknown comparison %s' % op
+        checks.append(functools.partial(compare, index[name.lower()],
+                                        op, value))
+    if len(checks) == 1:
+        return checks[0]
+    return lambda row: all(check(row) for check in checks)
+
+
+def _filters(where):
+    """
+    `_filters` returns the filters in `where` as a list.
+    """
+    if where is None:
+        return []
+    if callable(where) or isinstance(where, tuple):
+        return [where]
+    return list(where)
+
+
+def _cell_value(cell):
+    """
+    `_cell_value` converts a trimmed, non-empty cell to an `int` or a
+    `float` if possible, and otherwise returns it as is.
+    """
+    try:
+        return int(cell)
+    except ValueError:
+        try:
+            return float(cell)
+        except ValueError:
+            return cell
+
+
+def _select(names, usecols):
+    """
+    `_select` returns the indices of the columns in `usecols`, which
+    may be column names (ignoring case) or indices. If `usecols` is
+    `None`, then `None` is returned, which selects every column.
+    """
+    if usecols is None:
+        return None
+    index = _name_index(names)
+    select = []
+    for col in usecols:
+        if isinstance(col, int):
+            assert 0 <= col < len(names), \
+                'Column index %d does not exist' % col
+            select.append(col)
+        else:
+            assert col.lower() in index, \
+                'Column name %s does not exist' % col
+            select.append(index[col.lower()])
+    return select
+
+
+def _selected(names, select):
+    """
+    `_selected` returns the names of the columns selected by `select`.
+    """
+    if select is None:
+        return names
+    return [names[i] for i in select]
+
+
+def _projector(select):
+    """
+    `_projector` returns a function that picks the cells selected by
+    `select` out of a row, or `None` if every cell is selected.
+    """
+    if select is None:
+        return None
+    elif len(select) == 0:
+        return lambda row: []
+    elif len(select) == 1:
+        i = select[0]
+        return lambda row: [row[i]]
+    getter = itemgetter(*select)
+    return lambda row: list(getter(row))
+
+
+def _mmap_reader(fname, delimiter=',', skip_header=False, usecols=None,
+                 where=None, encoding=None):
+    """
+    `_mmap_reader` is like `qcsv._reader`, except the file is memory
+    mapped and each row is a list of `bytes` cells with ASCII whitespace
+    trimmed, suitable for `qcsv._Loader.feed_bytes`. Cells that aren't
+    in `usecols` are dropped before they are trimmed.
+
+    Lines without quote characters are split on `delimiter` directly.
+    Records with quotes are decoded and handed to Python's `csv`
+    module, and their cells are encoded again with `encoding`. (The
+    encoding must be a superset of ASCII, such as UTF-8.) If `encoding`
+    is `None` (on Python 2), nothing is decoded, and names and cells
+    are the byte strings that `qcsv._reader` would return.
+    """
+    if encoding is None:
+        delim = delimiter
+
+        def decode(cell):
+            return cell
+    else:
+        delim = delimiter.encode(encoding)
+
+        def decode(cell):
+            return cell.decode(encoding)
+    f = open(fname, 'rb')
+    if os.fstat(f.fileno()).st_size == 0:
+        f.close()
+        return [], iter([])
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def records():
+        for line in iter(mm.readline, b''):
+            if b'"' not in line:
+                line = line.rstrip(b'\r\n')
+                if len(line) == 0:
+                    yield []
+                    continue
+                yield line.split(delim)
+                continue
+            if line.count(b'"') % 2 == 1:
+                line += _next_record(mm, 1)
+            row = next(csv.reader(_lines(line, encoding),
+                                  delimiter=delimiter))
+            if encoding is not None:
+                row = [cell.encode(encoding) for cell in row]
+            yield row
+
+    reader = records()
+    names = []
+    if not skip_header:
+        names = [decode(cell).strip() for cell in next(reader, [])]
+    first = []
+    if len(names) == 0:
+        first = list(itertools.islice(reader, 1))
+        if len(first) > 0:
+            names = list(map(str, range(0, len(first[0]))))
+    select = _select(names, usecols)
+    project = _projector(select)
+    keep = _predicate(names, where, None if encoding is None else decode)
+
+    def rows():
+        try:
+            for i, row in enumerate(itertools.chain(first, reader)):
+                assert len(row) == len(names), \
+                    'The length of row %d is %d, but others rows have ' \
+                    'length %d' % (i, len(row), len(names))
+                if keep is not None and not keep(row):
+                    continue
+                if project is not None:
+                    row = project(row)
+                yield list(map(bytes.strip, row))
+        finally:
+            mm.close()
+            f.close()
+    return _selected(names, select), rows()
+
+
+def read_files(fnames, delimiter=',', skip_header=False, usecols=None,
+               where=None, processes=None, source=None, chunks=False):
+    """
+    `read_files` loads many CSV files with the same columns as a single
+    `qcsv.Table`. `fnames` is a list of paths, or a glob pattern, in
+    which case the matching files are read in sorted order.
+
+    Each file is loaded as in the single pass mode of `qcsv.read`, and
+    their rows are concatenated in order. Column types are merged with
+    the same promotion rules as `qcsv._column_types`, so a column that
+    has integers in one file and floats in another has type `float`.
+    Only the cells of a column that is promoted are converted again.
+
+    Columns are matched by name (ignoring case) to those of the first
+    file, so they may be in a different order in other files. When
+    `skip_header` is set, they're matched by position instead.
+    `delimiter`, `usecols` and `where` are described in `qcsv.read`.
+
+    If `processes` is greater than one, files are loaded by a pool of
+    that many processes. Any functions in `where` must be picklable.
+
+    If `source` is set, a `str` column with that name is added to the
+    end of the table, with the path of the file that each row came from.
+
+    If `chunks` is set, an iterator is returned instead, which yields a
+    `qcsv.Table` for each file as soon as it is loaded. Since later files
+    haven't been seen yet, each table only has the types inferred from
+    its own file.
+    """
+    if isinstance(fnames, text_type):
+        fnames = sorted(glob.glob(fnames))
+    assert len(fnames) > 0, 'No files to read'
+    args = [(fname, delimiter, skip_header, usecols, where, source)
+            for fname in fnames]
+    loaded = _load_files(args, processes)
+    if chunks:
+        return _file_tables(loaded)
+
+    loader, names = None, None
+    for _, file_names, other in loaded:
+        if loader is None:
+            loader, names = other, file_names
+            continue
+        _align(other, file_names, names)
+        loader.merge(other)
+    return loader.table(names)
+
+
+def _load_files(args, processes):
+    """
+    `_load_files` returns an iterator over the result of
+    `qcsv._load_file` for each file in `args`, in order. Files are
+    loaded by a pool of `processes` processes if there's more than one.
+    """
+    if processes is None or processes <= 1:
+        for a in args:
+            yield _load_file(a)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for loaded in pool.imap(_load_file, args):
+            yield loaded
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _load_file(args):
+    """
+    `_load_file` loads a file with a `qcsv._Loader` for
+    `qcsv.read_files`, and returns the file name, the column names and
+    the loader.
+    """
+    fname, delimiter, skip_header, usecols, where, source = args
+    names, rows = _reader(fname, delimiter, skip_header, usecols, where)
+    loader = _Loader(len(names))
+    loader.feed(rows)
+    if source is not None:
+        assert source.lower() not in set(n.lower() for n in names), \
+            'Column name %s already exists' % source
+        names = names + [source]
+        loader.types.append(str)
+        loader.raw.append({})
+        for row in loader.rows:
+            row.append(fname)
+    return fname, names, loader
+
+
+def _file_tables(loaded):
+    """
+    `_file_tables` yields a `qcsv.Table` for each file loaded by
+    `qcsv._load_files`, with the columns in the order of the first file.
+    """
+    first = None
+    for _, names, loader in loaded:
+        if first is None:
+            first = names
+        _align(loader, names, first)
+        yield loader.table(first)
+
+
+def _align(loader, names, target):
+    """
+    `_align` reorders the columns of `loader`, which are named `names`,
+    to match the column names in `target`.
+    """
+    if names == target:
+        return
+    index = _name_index(names)
+    assert len(names) == len(target), \
+        'Files have different numbers of columns: %s and %s' \
+        % (names, target)
+    order = []
+    for name in target:
+        assert name.lower() in index, 'Column name %s does not exist' % name
+        order.append(index[name.lower()])
+    project = _projector(order)
+    loader.rows[:] = map(project, loader.rows)
+    loader.types[:] = [loader.types[c] for c in order]
+    loader.raw[:] = [loader.raw[c] for c in order]
+
+
+class Tail(object):
+    """
+    `Tail` reads a CSV file that is being appended to, like a log. Each
+    call to `qcsv.Tail.refresh` parses only the records that were added
+    to the file since the last call, and appends them to the table.
+
+    The byte offset of the end of the last complete record is kept,
+    along with the `qcsv._Loader` that holds each column's type, so new
+    rows are type inferred and cast as in the single pass mode of
+    `qcsv.read`. If new cells widen a column's type, only that column is
+    converted again. A record is only read once the newline that ends
+    it has been written, and, as with the `processes` option of
+    `qcsv.read`, a `"` must only appear inside of quoted fields.
+
+    If the file is ever shorter than the offset (e.g., it was truncated
+    or replaced by log rotation), it is read again from the start.
+
+    `fname`, `delimiter`, `skip_header`, `usecols` and `where` are
+    described in `qcsv.read`, except that `fname` must be the path of
+    an uncompressed file.
+    """
+    def __init__(self, fname, delimiter=',', skip_header=False,
+                 usecols=None, where=None):
+        self.fname = fname
+        self.delimiter = delimiter
+        self.skip_header = skip_header
+        self.usecols = usecols
+        self.where = where
+        self._reset()
+
+    def refresh(self):
+        """
+        `refresh` loads any new records, and returns the table of every
+        row loaded so far. The table's rows and types are this reader's
+        own list and dictionary, which later refreshes update in place
+        (appending rows and converting columns whose type is widened),
+        so every table returned stays consistent with the latest one.
+        """
+        with open(self.fname, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < self.offset:
+                self._reset()
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        end = _complete(data)
+        if end == 0:
+            return self.table
+        self.offset += end
+        reader = csv.reader(_lines(data[:end],
+                                   locale.getpreferredencoding(False)),
+                            delimiter=self.delimiter)
+        if self._loader is None:
+            reader = self._start(reader)
+        self._loader.feed(_strip_rows(reader, self._ncols, self._select,
+                                      self._keep))
+        self.table.types.update(zip(self.names, self._loader.types))
+        return self.table
+
+    def _reset(self):
+        self.offset = 0
+        self.names = []
+        self.table = Table(types={}, names=[], rows=[])
+        self._loader = None
+
+    def _start(self, reader):
+        # Read the header, or peek at the first row to count columns.
+        first = next(reader)
+        if self.skip_header:
+            names = list(map(str, range(0, len(first))))
+            reader = itertools.chain([first], reader)
+        else:
+            names = list(map(str.strip, first))
+        self._ncols = len(names)
+        self._select = _select(names, self.usecols)
+        self._keep = _predicate(names, self.where)
+        self.names = _selected(names, self._select)
+        self._loader = _Loader(len(self.names))
+        self.table = self._loader.table(self.names)
+        return reader
+
+
+__pdoc__['Tail.offset'] = '''
+The byte offset in the file after the last record that was loaded.
+'''
+__pdoc__['Tail.names'] = '''
+The column names of the table, once the first record has been read.
+'''
+__pdoc__['Tail.table'] = '''
+The `qcsv.Table` returned by the last call to `qcsv.Tail.refresh`.
+'''
+
+
+def _complete(data):
+    """
+    `_complete` returns the length of the longest prefix of `data` that
+    ends with a complete record, i.e., a newline outside of quotes.
+    """
+    end = data.rfind(b'\n')
+    quotes = data.count(b'"', 0, max(end, 0))
+    while end >= 0 and quotes % 2 == 1:
+        prev = data.rfind(b'\n', 0, end)
+        quotes -= data.count(b'"', prev + 1, end)
+        end = prev
+    return end + 1
+
+
+def _read_parallel(fname, delimiter, skip_header, usecols, where,
+                   processes):
+    """
+    `_read_parallel` is like the single pass mode of `qcsv.read`, except
+    the file is split into `processes` chunks that are loaded in a pool
+    of processes. The chunks are merged in order by promoting column
+    types the same way that `qcsv._column_types` does.
+
+    Chunks are split at record boundaries, which are found by counting
+    quote characters. So a `"` must only appear inside of quoted fields,
+    as with files written by Python's `csv` module. Any functions in
+    `where` must be picklable.
+    """
+    encoding = locale.getpreferredencoding(False)
+    with open(fname, 'rb') as f:
+        header = _next_record(f)
+        start = f.tell()
+    names = []
+    if len(header) > 0:
+        names = next(csv.reader(_lines(header, encoding),
+                                delimiter=delimiter))
+        names = list(map(str.strip, names))
+    if skip_header:
+        names = list(map(str, range(0, len(names))))
+        start = 0
+    select = _select(names, usecols)
+
+    bounds = _boundaries(fname, start, processes)
+    chunks = [(fname, a, b, delimiter, names, select, where, encoding)
+              for a, b in zip(bounds, bounds[1:])]
+    names = _selected(names, select)
+    loader = _Loader(len(names))
+    pool = multiprocessing.Pool(processes)
+    try:
+        for chunk in pool.imap(_load_chunk, chunks):
+            loader.merge(chunk)
+    finally:
+        pool.close()
+        pool.join()
+    return loader.table(names)
+
+
+def _load_chunk(args):
+    """
+    `_load_chunk` loads the bytes between two record boundaries of a file
+    with a `qcsv._Loader`, and returns the loader.
+    """
+    fname, a, b, delimiter, names, select, where, encoding = args
+    with open(fname, 'rb') as f:
+        f.seek(a)
+        data = f.read(b - a)
+    loader = _Loader(len(_selected(names, select)))
+    reader = csv.reader(_lines(data, encoding), delimiter=delimiter)
+    loader.feed(_strip_rows(reader, len(names), select,
+                            _predicate(names, where)))
+    return loader
+
+
+def _lines(data, encoding):
+    """
+    `_lines` returns a file object for reading the bytes `data` with
+    Python's `csv` module, as `qcsv._open` does for a file. On Python 3,
+    `data` is decoded with `encoding` and newlines are translated in the
+    same way that opening a file in text mode does. On Python 2, whose
+    `csv` module reads bytes, `data` is read as is.
+    """
+    if text_type is not str:
+        return io.BytesIO(data)
+    return io.TextIOWrapper(io.BytesIO(data), encoding=encoding)
+
+
+def _boundaries(fname, start, n):
+    """
+    `_boundaries` returns a list of byte offsets of record boundaries
+    that split the file `fname` after the offset `start` into at most
+    `n` chunks of roughly equal size. The first offset is `start` and
+    the last is the size of the file.
+    """
+    size = os.path.getsize(fname)
+    bounds = [start]
+    with open(fname, 'rb') as f:
+        f.seek(start)
+        # Since `start` is a record boundary, we're inside a quoted field
+        # whenever an odd number of quotes have been seen since then.
+        quotes = 0
+        for k in range(1, n):
+            target = start + (size - start) * k // n
+            while f.tell() < target:
+                quotes += f.read(min(target - f.tell(), 1 << 20)).count(b'"')
+            # Now finish the record that `target` is in.
+            quotes += _next_record(f, quotes).count(b'"')
+            if f.tell() > bounds[-1]:
+                bounds.append(f.tell())
+    if size > bounds[-1]:
+        bounds.append(size)
+    return bounds
+
+
+def _next_record(f, quotes=0):
+    """
+    `_next_record` reads lines from the binary file `f` until the end of
+    a record, i.e., a newline that isn't inside a quoted field, and
+    returns what was read. `quotes` is the number of quotes seen since
+    the beginning of the record.
+    """
+    lines = []
+    while True:
+        line = f.readline()
+        lines.append(line)
+        quotes += line.count(b'"')
+        if len(line) == 0 or quotes % 2 == 0:
+            return b''.join(lines)
+
+
+def _cast_rows(types, names, rows):
+    """
+    `_cast_rows` lazily casts each row in the iterator `rows` according
+    to `types`, in the same manner as `qcsv.cast`. A `ValueError` is
+    raised for any cell that does not fit its column's type, including
+    any non-empty cell in a column with type `None`.
+    """
+    typs = [types[name] for name in names]
+    for r, row in enumerate(rows):
+        new_row = [None] * len(row)
+        for c, cell in enumerate(row):
+            typ = typs[c]
+            if len(cell) == 0:
+                continue
+            try:
+                if typ is None:
+                    raise ValueError
+                new_row[c] = typ(cell)
+            except ValueError:
+                raise ValueError('Cell %r in row %d of column %s does not '
+                                 'have type %s'
+                                 % (cell, r, names[c], type_str(typ)))
+        yield new_row
+
+
+class _Loader(object):
+    """
+    `_Loader` parses, infers and casts rows in a single pass. It keeps
+    track of the type of each column seen so far and converts each cell
+    as it goes. When a cell doesn't fit its column's type, the column
+    is promoted (as in `qcsv._promote`) and only the cells already
+    loaded in that column are converted again.
+
+    This gives the same result as `qcsv._column_types` followed by
+    `qcsv.cast`, without building an intermediate table of strings.
+    """
+    def __init__(self, ncols):
+        # The type of each column seen so far.
+        self.types = [None] * ncols
+
+        # The rows loaded so far, with cells cast to the types above.
+        self.rows = []
+
+        # Promoting a numeric column to `str` needs the original text of
+        # each cell. That's usually just `str(value)`, so we only remember
+        # the text of the cells where it isn't (e.g., "1.50" or "007").
+        # This maps row indices to text for each column.
+        self.raw = [{} for _ in range(ncols)]
+
+    def feed(self, rows):
+        """
+        `feed` loads each row from the iterator `rows`, where each row
+        is a list of trimmed strings. Rows are modified in place.
+        """
+        types, raw, out = self.types, self.raw, self.rows
+        for row in rows:
+            r = len(out)
+            for c, cell in enumerate(row):
+                if not cell:
+                    row[c] = None
+                    continue
+                typ = types[c]
+                if typ is str:
+                    continue
+                try:
+                    value = float(cell) if typ is float else int(cell)
+                except ValueError:
+                    self.widen(row, r, c, cell)
+                    continue
+                if typ is None:
+                    types[c] = int
+                if str(value) != cell:
+                    raw[c][r] = cell
+                row[c] = value
+            out.append(row)
+
+    def feed_bytes(self, rows, encoding):
+        """
+        `feed_bytes` is like `feed`, except each cell is a `bytes` value
+        with ASCII whitespace trimmed. Numbers are converted straight from
+        the bytes. A cell is only decoded with `encoding` when it is kept
+        as a string or isn't a plain ASCII number. If `encoding` is `None`
+        (on Python 2), cells are already strings, so this is `feed`.
+        """
+        if encoding is None:
+            return self.feed(rows)
+        types, raw, out = self.types, self.raw, self.rows
+        for row in rows:
+            r = len(out)
+            for c, cell in enumerate(row):
+                if not cell:
+                    row[c] = None
+                    continue
+                typ = types[c]
+                if typ is not str:
+                    try:
+                        value = float(cell) if typ is float else int(cell)
+                    except ValueError:
+                        pass
+                    else:
+                        if typ is None:
+                            types[c] = typ = int
+                        if (b'%r' if typ is float else b'%d') % value != cell:
+                            raw[c][r] = cell.decode('ascii')
+                        row[c] = value
+                        continue
+
+                # The cell may still be a number with Unicode digits or
+                # whitespace, so now do exactly what `feed` does.
+                text = row[c] = cell.decode(encoding).strip()
+                if len(text) == 0:
+                    row[c] = None
+                elif typ is not str:
+                    try:
+                        value = float(text) if typ is float else int(text)
+                    except ValueError:
+                        self.widen(row, r, c, text)
+                        continue
+                    if typ is None:
+                        types[c] = int
+                    if str(value) != text:
+                        raw[c][r] = text
+                    row[c] = value
+            out.append(row)
+
+    def widen(self, row, r, c, text):
+        """
+        `widen` handles the cell `text` in column `c` of `row`, which is
+        the `r`th row, when the cell doesn't fit the column's current
+        type. The column is promoted to `float` or `str`.
+        """
+        row[c] = text
+        if self.types[c] is not float:
+            try:
+                value = float(text)
+            except ValueError:
+                pass
+            else:
+                self.promote(c, float)
+                if str(value) != text:
+                    self.raw[c][r] = text
+                row[c] = value
+                return
+        self.promote(c, str)
+
+    def promote(self, c, typ):
+        """
+        `promote` widens the type of column `c` to fit a cell with type
+        `typ`, and converts the cells already loaded in that column.
+        """
+        old = self.types[c]
+        new = self.types[c] = _promote(old, typ)
+        if old is None or new is old:
+            return
+
+        raw = self.raw[c]
+        if new is float:
+            for r, row in enumerate(self.rows):
+                if row[c] is None:
+                    continue
+                text = raw.get(r) or str(row[c])
+                row[c] = float(text)
+                if str(row[c]) != text:
+                    raw[r] = text
+        else:
+            for r, row in enumerate(self.rows):
+                if row[c] is None:
+                    continue
+                row[c] = raw.get(r) or str(row[c])
+            self.raw[c] = {}
+
+    def merge(self, other):
+        """
+        `merge` appends the rows loaded by another `qcsv._Loader` to
+        this one, promoting the types of the columns in either loader as
+        necessary.
+        """
+        offset = len(self.rows)
+        for c, typ in enumerate(other.types):
+            typ = _promote(self.types[c], typ)
+            self.promote(c, typ)
+            other.promote(c, typ)
+            for r, text in other.raw[c].items():
+                self.raw[c][offset + r] = text
+        self.rows.extend(other.rows)
+
+    def table(self, names):
+        """
+        `table` returns the rows loaded so far as a `qcsv.Table` with
+        the given column names.
+        """
+        return Table(types=dict(zip(names, self.types)), names=names,
+                     rows=self.rows)
 
 
 def _column_types(names, rows):
@@ -119,59 +2092,89 @@ def _column_types(names, rows):
     empty or integers AND at least one value is an int.
 
     A column has type `str` in any other case.
+
+    Each column is classified all at once: the set of characters in
+    the column decides whether it can only be `int` or `float`, and
+    then every cell is converted with that one type in a single call to
+    `map`. This gives the same answer as trying `int(cell)` and then
+    `float(cell)` on every cell, but without any per cell Python code or
+    exception handling.
     """
     types = dict([(name, None) for name in names])
+    for c, name in enumerate(names):
+        types[name] = _column_type(list(map(itemgetter(c), rows)))
+    return types
 
-    for c in range(len(names)):
-        # prev_typ is what we believe the type of this column to be up
-        # until this point.
-        prev_typ = None
-
-        # next_typ is the type of the current cell only. It is compared
-        # with prev_typ to determine the type of the overall column as
-        # per the conditions specified in this function's documentation.
-        next_typ = None
 
-        for row in rows:
-            col = row[c]
-
-            # A missing value always has type None.
-            if len(col) == 0:
-                next_typ = None
-            # No need to inspect the type if we've already committed to str.
-            # (We bail out because it's expensive to inspect types like this.)
-            elif prev_typ is not str:
-                # The trick here is to attempt type casting from a stirng to
-                # an int or a string to a float, and if Python doesn't like it,
-                # we try something else.
-                try:
-                    # We try int first, since any integer can be successfully
-                    # converted to a float, but not all floats can converted
-                    # to integers.
-                    int(col)
-                    next_typ = int
-                except ValueError:
-                    try:
-                        # If we can't convert to float, then we must scale back
-                        # to a string.
-                        float(col)
-                        next_typ = float
-                    except ValueError:
-                        next_typ = str
-
-            # If a column contains a string, the column type is always a
-            # string.
-            if prev_typ is str or next_typ is str:
-                prev_typ = str
-            # A column with floats and ints has type float.
-            elif next_typ is float and prev_typ is int:
-                prev_typ = float
-            # A column with missing values and X has type X.
-            elif prev_typ is None and next_typ is not None:
-                prev_typ = next_typ
-
-        types[names[c]] = prev_typ
-    return types
+def _column_type(cells):
+    """
+    `_column_type` infers the type of a single column of cells, as
+    described in `qcsv._column_types`.
+    """
+    cells = list(filter(None, cells))
+    if len(cells) == 0:
+        return None
+
+    # Only digits, signs, underscores and whitespace can appear in an
+    # integer. If anything else shows up in the column, then at least one
+    # cell is not an integer, so the column is float if every cell can
+    # be converted to a float and str otherwise. If nothing else shows
+    # up, then no cell can be a float unless it is also an integer.
+    # Either way, we only need to try one conversion on each cell.
+    chars = set(''.join(cells))
+    if all(ch.isdigit() or ch in '+-_' or ch.isspace() for ch in chars):
+        typ = int
+    else:
+        typ = float
+    try:
+        deque(map(typ, cells), maxlen=0)
+    except ValueError:
+        return str
+    return typ
+
+
+def _cell_type(cell):
+    """
+    `_cell_type` returns the type of a single cell: `None` if it is
+    empty, otherwise `int`, `float` or `str`.
+    """
+    # A missing value always has type None.
+    if len(cell) == 0:
+        return None
+    # The trick here is to attempt type casting from a stirng to an int
+    # or a string to a float, and if Python doesn't like it, we try
+    # something else.
+    try:
+        # We try int first, since any integer can be successfully
+        # converted to a float, but not all floats can converted to
+        # integers.
+        int(cell)
+        return int
+    except ValueError:
+        try:
+            # If we can't convert to float, then we must scale back to
+            # a string.
+            float(cell)
+            return float
+        except ValueError:
+            return str
+
+
+def _promote(prev_typ, next_typ):
+    """
+    `_promote` returns the type of a column that was believed to have
+    type `prev_typ` after seeing a cell with type `next_typ`.
+    """
+    # If a column contains a string, the column type is always a string.
+    if prev_typ is str or next_typ is str:
+        return str
+    # A column with floats and ints has type float.
+    elif next_typ is float and prev_typ is int:
+        return float
+    # A column with missing values and X has type X.
+    elif prev_typ is None and next_typ is not None:
+        return next_typ
+    return prev_typ
 
 
 def map_names(table, f):
@@ -189,7 +2192,7 @@ def map_names(table, f):
     return table._replace(names=new_names)
 
 
-def map_data(table, f):
+def map_data(table, f, stats=None):
     """
     `map_data` executes `f` on every cell in `table` with five
     arguments, in order: column type, column name, row index, column
@@ -197,7 +2200,21 @@ def map_data(table, f):
     corresponding cell location.
 
     A new `qcsv.Table` is returned with the converted values.
+
+    If `stats` is a `qcsv.Stats`, the work is recorded in it as a stage.
     """
+    if stats is not None:
+        return _staged(stats, 'map_data', map_data, table, f)
+    table = collect(table)
+    if isinstance(table, ColumnTable):
+        new_cols = []
+        for c, name in enumerate(table.names):
+            typ = table.types[name]
+            cells = table.columns[c].tolist()
+            new_cols.append(_array(typ, [f(typ, name, r, c, cell)
+                                         for r, cell in enumerate(cells)]))
+        return table._replace(columns=new_cols)
+
     new_rows = [None] * len(table.rows)
     for r, row in enumerate(table.rows):
         new_row = [None] * len(row)
@@ -209,7 +2226,71 @@ def map_data(table, f):
     return table._replace(rows=new_rows)
 
 
-def cast(table):
+def map_columns(table, f, stats=None):
+    """
+    `map_columns` executes `f` on every column in `table` with three
+    arguments, in order: column type, column name, cells. The cells
+    are a list for a `qcsv.Table` and a masked array for a
+    `qcsv.ColumnTable`. The result of the function, which may be a list
+    or an array, replaces the column's cells.
+
+    If `f` returns the cells it was given, the column is left alone.
+    (In a `qcsv.ColumnTable`, the new table shares it with `table`.)
+
+    A new table is returned with the converted values.
+
+    If `stats` is a `qcsv.Stats`, the work is recorded in it as a stage.
+    """
+    if stats is not None:
+        return _staged(stats, 'map_columns', map_columns, table, f)
+    table = collect(table)
+    fs = {}
+    for c, name in enumerate(table.names):
+        fs[c] = functools.partial(f, table.types[name], name)
+    return _map_columns(table, fs)
+
+
+def _map_columns(table, fs):
+    """
+    `_map_columns` is like `qcsv.map_columns`, except `fs` is a
+    dictionary from column index to a function of one argument, the
+    cells of that column. Columns without a function are not touched.
+    """
+    if isinstance(table, ColumnTable):
+        new_cols = list(table.columns)
+        for c, f in fs.items():
+            cells = f(table.columns[c])
+            if cells is table.columns[c]:
+                continue
+            if isinstance(cells, Categorical):
+                new_cols[c] = cells
+                continue
+            if not isinstance(cells, np.ndarray):
+                cells = _array(table.types[table.names[c]], cells)
+            new_cols[c] = np.ma.asarray(cells)
+        return table._replace(columns=new_cols)
+
+    if len(fs) == 0 or len(table.rows) == 0:
+        return table
+    cols = [None] * len(table.names)
+    for c in range(len(table.names)):
+        cols[c] = list(map(itemgetter(c), table.rows))
+        if c in fs:
+            cols[c] = fs[c](cols[c])
+    return table._replace(rows=list(map(list, zip(*cols))))
+
+
+def _cell_list(cells):
+    """
+    `_cell_list` returns the cells of a column as a list, where masked
+    cells are `None`.
+    """
+    if isinstance(cells, (np.ndarray, Categorical)):
+        return cells.tolist()
+    return cells
+
+
+def cast(table, promote=False, stats=None):
     """
     `cast` type casts all of the values in `table` to their
     corresponding types in `qcsv.Table.types`.
@@ -218,35 +2299,192 @@ def cast(table):
     value is missing or a column has type NULL (i.e., all values are
     missing), then the value is replaced with `None`.
 
+    If a value cannot be cast to its column's type, a `ValueError` is
+    raised. Unless `promote` is set, in which case the column's type is
+    widened to fit the value (from `None` to `int` to `float` to `str`),
+    and only that column is cast again. (NULL columns are also widened
+    when they contain a value, instead of having it replaced with
+    `None`.) This is useful when types were inferred from only some of
+    the rows, as with the `sample` option of `qcsv.read`.
+
+    Columns of a `qcsv.ColumnTable` that are already stored as arrays of
+    their type are shared with the new table.
+
+    If `stats` is a `qcsv.Stats`, the work is recorded in it as a stage.
+
     N.B. cast is idempotent. i.e., `cast(x) = cast(cast(x))`.
     """
-    def f(typ, name, r, c, cell):
-        if (isinstance(cell, text_type) and len(cell) == 0) \
-                or typ is None or cell is None:
-            return None
+    if stats is not None and not isinstance(table, LazyTable):
+        return _staged(stats, 'cast', cast, table, promote)
+    if isinstance(table, LazyTable):
+        # Promotion depends on the data, so it can't be deferred.
+        if promote:
+            return cast(collect(table), promote=True)
+        return _record(table, dict(
+            (c, functools.partial(_cast_cell, table.types[name], name))
+            for c, name in enumerate(table.names)))
+
+    types = dict(table.types)
+    columnar = isinstance(table, ColumnTable)
+
+    def f(name, cells):
+        typ = types[name]
+        if isinstance(cells, np.ndarray) and typ in _dtypes \
+                and cells.dtype.kind == np.dtype(_dtypes[typ]).kind:
+            return cells
+        if isinstance(cells, Categorical) and typ is str:
+            return cells
+        if typ is str and isinstance(cells, np.ndarray) \
+                and cells.dtype.kind == 'O' \
+                and all(type(s) is str for s in np.ma.compressed(cells)):
+            return cells
+        cells = _cell_list(cells)
+        if typ is int or typ is float:
+            # Convert the whole column at once, or let the slow path below
+            # promote the column or say which cell is bad.
+            try:
+                if columnar:
+                    return _numbers(typ, cells)
+                if cells.count('') == 0 and cells.count(None) == 0:
+                    return list(map(typ, cells))
+            except ValueError:
+                pass
+        types[name], cells = _cast_cells(typ, name, cells, promote)
+        return cells
+    fs = {}
+    for c, name in enumerate(table.names):
+        fs[c] = functools.partial(f, name)
+    return _map_columns(table, fs)._replace(types=types)
+
+
+def _cast_cells(typ, name, cells, promote):
+    """
+    `_cast_cells` casts a list of cells from the column `name` to `typ`
+    as described in `qcsv.cast`, and returns the type of the column
+    (which may have been promoted) along with the new cells.
+    """
+    new_cells = [None] * len(cells)
+    if typ is None and not promote:
+        return typ, new_cells
+    for r, cell in enumerate(cells):
+        if (isinstance(cell, text_type) and len(cell) == 0) or cell is None:
+            continue
+        try:
+            if typ is None:
+                raise ValueError('Column %s has type None' % name)
+            new_cells[r] = typ(cell)
+        except ValueError:
+            if not promote:
+                raise ValueError('Cell %r in row %d of column %s does not '
+                                 'have type %s'
+                                 % (cell, r, name, type_str(typ)))
+            # Start over on just this column with the wider type.
+            typ = _promote(typ, _cell_type(str(cell)))
+            return _cast_cells(typ, name, cells, promote)
+    return typ, new_cells
+
+
+def _numbers(typ, cells):
+    """
+    `_numbers` converts a list of cells to a masked `int64` or `float64`
+    array in one call, where empty and `None` cells are masked. Each cell
+    is converted by `typ` just as in `qcsv._cast_cells`, so integers that
+    overflow `int64` are kept in an array of Python objects instead. A
+    `ValueError` is raised if a cell isn't a number.
+    """
+    n = len(cells)
+    mask = np.ma.nomask
+    if cells.count('') > 0 or cells.count(None) > 0:
+        objs = np.empty(n, dtype=object)
+        objs[:] = cells
+        mask = (np.equal(objs, '') | np.equal(objs, None)).astype(bool)
+        objs[mask] = 0
+        cells = objs
+    try:
+        data = np.fromiter(map(typ, cells), dtype=_dtypes[typ], count=n)
+    except OverflowError:
+        data = np.empty(n, dtype=object)
+        data[:] = list(map(typ, cells))
+    return np.ma.array(data, mask=mask)
+
+
+def _cast_cell(typ, name, cell):
+    """
+    `_cast_cell` casts a single cell from the column `name` to `typ` as
+    described in `qcsv.cast`.
+    """
+    if (isinstance(cell, text_type) and len(cell) == 0) \
+            or typ is None or cell is None:
+        return None
+    try:
         return typ(cell)
-    return map_data(table, f)
+    except ValueError:
+        raise ValueError('Cell %r of column %s does not have type %s'
+                         % (cell, name, type_str(typ)))
 
 
-def convert_missing_cells(table, dstr="", dint=0, dfloat=0.0):
+def convert_missing_cells(table, dstr="", dint=0, dfloat=0.0,
+                          stats=None):
     """
     `convert_missing_cells` changes the values of all NULL cells to the
     values specified by `dstr`, `dint` and `dfloat`. For example, all
     NULL cells in columns with type `str` will be replaced with the
     value given to `dstr`.
+
+    In a `qcsv.ColumnTable`, this fills in the masked cells of each
+    column.
+
+    If `stats` is a `qcsv.Stats`, the work is recorded in it as a stage.
     """
-    def f(typ, name, r, c, cell):
-        if cell is None and typ is not None:
-            if typ == str:
-                return dstr
-            elif typ == int:
-                return dint
-            elif typ == float:
-                return dfloat
-            else:
-                assert False, "Unknown type: %s" % typ
-        return cell
-    return map_data(table, f)
+    if stats is not None and not isinstance(table, LazyTable):
+        return _staged(stats, 'convert_missing_cells', convert_missing_cells,
+                       table, dstr, dint, dfloat)
+    defaults = {str: dstr, int: dint, float: dfloat}
+
+    def fcell(d, cell):
+        return d if cell is None else cell
+
+    def f(typ, cells):
+        if isinstance(cells, Categorical):
+            return _convert_categorical(
+                functools.partial(fcell, defaults[typ]), cells)
+        if isinstance(cells, np.ndarray):
+            return _fill(cells, defaults[typ])
+        d = defaults[typ]
+        return [d if cell is None else cell for cell in cells]
+    fs = {}
+    for c, name in enumerate(table.names):
+        typ = table.types[name]
+        if typ is None:
+            continue
+        assert typ in defaults, "Unknown type: %s" % typ
+        if isinstance(table, LazyTable):
+            fs[c] = functools.partial(fcell, defaults[typ])
+        else:
+            fs[c] = functools.partial(f, typ)
+    if isinstance(table, LazyTable):
+        return _record(table, fs)
+    return _map_columns(table, fs)
+
+
+def _fill(cells, value):
+    """
+    `_fill` returns a copy of the masked array `cells` without a mask,
+    where masked cells are replaced by `value`.
+    """
+    mask = np.ma.getmask(cells)
+    if mask is np.ma.nomask:
+        return cells
+    dtype = cells.dtype
+    fill = np.asarray(value)
+    if dtype.kind == 'U' and fill.dtype.kind == 'U':
+        # Don't truncate a fill value that is longer than every string.
+        dtype = np.promote_types(dtype, fill.dtype)
+    elif not np.can_cast(fill.dtype, dtype, 'same_kind'):
+        dtype = object
+    data = cells.data.astype(dtype)
+    data[mask] = value
+    return np.ma.asarray(data)
 
 
 def convert_columns(table, **kwargs):
@@ -262,12 +2500,15 @@ def convert_columns(table, **kwargs):
 
     would convert all values in the column with name `colname` to
     lowercase.
+
+    Only the named columns are visited. To convert an entire column at
+    once, use `qcsv.map_columns`.
     """
-    def f(typ, name, r, c, cell):
+    fs = {}
+    for c, name in enumerate(table.names):
         if name in kwargs:
-            return kwargs[name](cell)
-        return cell
-    return map_data(table, f)
+            fs[c] = kwargs[name]
+    return _convert(table, fs)
 
 
 def convert_types(table, fstr=None, fint=None, ffloat=None):
@@ -275,15 +2516,53 @@ def convert_types(table, fstr=None, fint=None, ffloat=None):
     `convert_types` works just like `qcsv.convert_columns`, but on
     types instead of specific columns.
     """
-    def f(typ, name, r, c, cell):
-        if typ == str and fstr is not None:
-            return fstr(cell)
-        elif typ == int and fint is not None:
-            return fint(cell)
-        elif typ == float and ffloat is not None:
-            return ffloat(cell)
-        return cell
-    return map_data(table, f)
+    converters = {str: fstr, int: fint, float: ffloat}
+    fs = {}
+    for c, name in enumerate(table.names):
+        if converters.get(table.types[name]) is not None:
+            fs[c] = converters[table.types[name]]
+    return _convert(table, fs)
+
+
+def _convert(table, fs):
+    """
+    `_convert` executes the cell functions in `fs`, a dictionary from
+    column index to function, on their columns. For a `qcsv.LazyTable`,
+    they are recorded instead.
+    """
+    if isinstance(table, LazyTable):
+        return _record(table, fs)
+    return _map_columns(table, dict((c, functools.partial(_convert_cells, f))
+                                    for c, f in fs.items()))
+
+
+def _convert_cells(f, cells):
+    """
+    `_convert_cells` executes `f` on every cell of a column.
+    """
+    if isinstance(cells, Categorical):
+        return _convert_categorical(f, cells)
+    return list(map(f, _cell_list(cells)))
+
+
+def _convert_categorical(f, cells):
+    """
+    `_convert_categorical` executes `f` once on each distinct value of a
+    `qcsv.Categorical`, and once on `None` if it has NULL cells. The
+    results are encoded again, since `f` may map distinct values to the
+    same value.
+    """
+    if len(cells.codes) == 0:
+        return cells
+    values = list(map(f, cells.categories.tolist()))
+    codes = np.ma.getdata(cells.codes)
+    mask = np.ma.getmask(cells.codes)
+    if mask is not np.ma.nomask and mask.any():
+        # NULL cells get a code of their own.
+        codes = np.where(mask, len(values), codes)
+        values.append(f(None))
+    encoded = _encode(values)
+    return encoded._replace(codes=encoded.codes[codes])
 
 
 def column(table, colname):
@@ -291,23 +2570,15 @@ def column(table, colname):
     `column` returns a named tuple `qcsv.Column` of the column in
     `table` with name `colname`.
     """
-    colcells = []
-    colname = colname.lower()
-    colindex = -1
-    for i, name in enumerate(table.names):
-        if name.lower() == colname.lower():
-            colindex = i
-            break
-    assert colindex > -1, 'Column name %s does not exist' % colname
-
-    for row in table.rows:
-        for i, col in enumerate(row):
-            if i == colindex:
-                colcells.append(col)
-
-    return Column(type=table.types[table.names[colindex]],
-                  name=table.names[colindex],
-                  cells=np.array(colcells))
+    table = collect(table)
+    i = table.column_index(colname)
+    if isinstance(table, ColumnTable):
+        cells = table.columns[i]
+    else:
+        cells = np.array(list(map(itemgetter(i), table.rows)))
+    return Column(type=table.types[table.names[i]],
+                  name=table.names[i],
+                  cells=cells)
 
 
 def columns(table):
@@ -315,12 +2586,14 @@ def columns(table):
     `columns` returns a list of all columns in the data set, where each
     column has type `qcsv.Column`.
     """
-    colcells = []
-    for _ in table.names:
-        colcells.append([])
-    for row in table.rows:
-        for i, col in enumerate(row):
-            colcells[i].append(col)
+    table = collect(table)
+    if isinstance(table, ColumnTable):
+        return [Column(type=table.types[name], name=name, cells=col)
+                for name, col in zip(table.names, table.columns)]
+
+    colcells = [[] for _ in table.names]
+    if len(table.rows) > 0:
+        colcells = list(zip(*table.rows))
 
     cols = []
     for i, name in enumerate(table.names):
@@ -331,15 +2604,424 @@ def columns(table):
     return cols
 
 
+def iter_column(table, colname):
+    """
+    `iter_column` returns an iterator over the cells of the column in
+    `table` with name `colname`. Unlike `qcsv.column`, this doesn't
+    build an array, so it can be used on the rows of a table returned
+    by `qcsv.stream` without loading them all into memory.
+    """
+    table = collect(table)
+    i = table.column_index(colname)
+    if isinstance(table, ColumnTable):
+        return iter(table.columns[i].tolist())
+    return (row[i] for row in table.rows)
+
+
 def frequencies(column):
     """
     `frequencies` returns a dictionary where the keys are unique values
     in the column, and the values correspond to the frequency of each
     value in the column.
+
+    `column` may be a `qcsv.Column` or any iterable of cells. Values are
+    counted with a hash table, so columns may mix `None` with other
+    values. Masked cells from a `qcsv.ColumnTable` are counted under
+    `None`. The codes of a `qcsv.Categorical` column are counted
+    directly.
+    """
+    cells = column.cells if isinstance(column, Column) else column
+    if isinstance(cells, Categorical):
+        counts = np.bincount(cells.codes.compressed(),
+                             minlength=len(cells.categories))
+        freqs = Counter()
+        for value, n in zip(cells.categories.tolist(), counts.tolist()):
+            if n > 0:
+                freqs[value] += n
+        nulls = int(np.ma.count_masked(cells.codes))
+        if nulls > 0:
+            freqs[None] += nulls
+        return freqs
+    return Counter(_iter_cells(column))
+
+
+def top_frequencies(column, k, capacity=None):
     """
-    ukeys = np.unique(column.cells)
-    bins = np.searchsorted(ukeys, column.cells)
-    return dict(zip(ukeys, np.bincount(bins)))
+    `top_frequencies` returns a list of the `k` most frequent values in
+    `column` as `(value, frequency)` pairs, in descending order of
+    frequency. `column` is as described in `qcsv.frequencies`.
+
+    By default, every value is counted exactly. If `capacity` is set,
+    then at most that many values are counted at any one time using
+    the Space-Saving algorithm, so memory stays bounded no matter how
+    many distinct values there are. In that case, a frequency may be
+    overestimated by at most the smallest frequency being tracked, but
+    any value that appears more than `n / capacity` times in a column
+    with `n` cells is guaranteed to be found.
+    """
+    if capacity is None:
+        return frequencies(column).most_common(k)
+    assert capacity >= k, 'capacity must be at least k'
+
+    counts = {}
+    # A min heap with one entry for each value in `counts`. An entry's
+    # frequency may be stale (too small), in which case it is refreshed
+    # when it reaches the top. The middle element breaks ties without
+    # comparing values, which may not be comparable.
+    heap = []
+    for i, cell in enumerate(_iter_cells(column)):
+        if cell in counts:
+            counts[cell] += 1
+            continue
+        if len(counts) < capacity:
+            counts[cell] = 1
+            heapq.heappush(heap, (1, i, cell))
+            continue
+        while counts[heap[0][2]] != heap[0][0]:
+            _, j, value = heap[0]
+            heapq.heapreplace(heap, (counts[value], j, value))
+        count, _, value = heapq.heappop(heap)
+        del counts[value]
+        counts[cell] = count + 1
+        heapq.heappush(heap, (count + 1, i, cell))
+    return heapq.nlargest(k, counts.items(), key=itemgetter(1))
+
+
+def _iter_cells(column):
+    """
+    `_iter_cells` returns an iterator over the cells of a `qcsv.Column`
+    or an iterable of cells, where masked cells are `None`.
+    """
+    if isinstance(column, Column):
+        column = column.cells
+    if isinstance(column, np.ma.MaskedArray):
+        nulls = np.ma.count_masked(column)
+        return itertools.chain(column.compressed().tolist(),
+                               itertools.repeat(None, nulls))
+    if isinstance(column, (np.ndarray, Categorical)):
+        return iter(column.tolist())
+    return iter(column)
+
+
+_aggregates = ('count', 'sum', 'mean', 'min', 'max', 'distinct')
+
+
+def group_by(table, by, aggs, size=10000):
+    """
+    `group_by` groups the rows of `table` by the values of the columns
+    named in `by` (a name or a list of names), and computes aggregates
+    over each group. `aggs` is a list of `(column name, aggregate)`
+    pairs, where the aggregate is one of `count`, `sum`, `mean`, `min`,
+    `max` or `distinct` (the number of distinct values).
+
+    A `qcsv.Table` is returned with one row for each group, in the order
+    that groups are first seen. Its columns are the `by` columns followed
+    by one column for each aggregate, named like `mean(price)`.
+
+    NULL cells are skipped by every aggregate, so `count` is the number
+    of cells in the group that aren't NULL, and an aggregate over a
+    group with no such cells is `None`. Rows with NULL keys are grouped
+    together under `None`.
+
+    Rows are hashed into groups, and aggregates are computed with NumPy
+    over each batch of rows. If the rows of `table` are an iterator (as
+    with `qcsv.stream`), they are consumed in batches of `size` rows,
+    so memory use depends on the number of groups rather than the
+    number of rows.
+    """
+    table = collect(table)
+    if isinstance(by, text_type):
+        by = [by]
+    for name, agg in aggs:
+        assert agg in _aggregates, 'Unknown aggregate %s' % agg
+    keyidx = [table.column_index(name) for name in by]
+    aggidx = [table.column_index(name) for name, _ in aggs]
+    for (name, agg), i in zip(aggs, aggidx):
+        assert agg not in ('sum', 'mean') \
+            or table.types[table.names[i]] is not str, \
+            'Cannot compute %s of a column with type str' % agg
+
+    if isinstance(table, ColumnTable) or isinstance(table.rows, list):
+        chunks = [table]
+    else:
+        chunks = batches(table, size)
+
+    groups = {}
+    states = [{} for _ in aggs]
+    for chunk in chunks:
+        keys = [_cell_list(_batch_column(chunk, i)) for i in keyidx]
+        keys = keys[0] if len(keys) == 1 else list(zip(*keys))
+        codes = np.fromiter((groups.setdefault(k, len(groups)) for k in keys),
+                            dtype=np.intp, count=len(keys))
+        for (_, agg), i, state in zip(aggs, aggidx, states):
+            _aggregate(state, agg, codes, _batch_column(chunk, i),
+                       len(groups))
+
+    names = [table.names[i] for i in keyidx]
+    types = dict((name, table.types[name]) for name in names)
+    cols = [list(groups)]
+    if len(keyidx) > 1:
+        cols = list(map(list, zip(*groups))) if groups else [[]] * len(by)
+    for (name, agg), i, state in zip(aggs, aggidx, states):
+        aggname = '%s(%s)' % (agg, table.names[i])
+        names.append(aggname)
+        types[aggname] = {'count': int, 'distinct': int, 'mean': float} \
+            .get(agg, table.types[table.names[i]])
+        cols.append(_aggregated(state, agg, len(groups)))
+    rows = list(map(list, zip(*cols))) if groups else []
+    return Table(types=types, names=names, rows=rows)
+
+
+def _batch_column(table, i):
+    """
+    `_batch_column` returns the `i`th column of `table` as a masked
+    array.
+    """
+    if isinstance(table, ColumnTable):
+        col = table.columns[i]
+        return col.decode() if isinstance(col, Categorical) else col
+    return _array(table.types[table.names[i]],
+                  list(map(itemgetter(i), table.rows)))
+
+
+def _grow(acc, n, fill, dtype):
+    """
+    `_grow` returns the array `acc` extended to length `n` with `fill`,
+    or a new array if `acc` is `None`.
+    """
+    if acc is None:
+        return np.full(n, fill, dtype=dtype)
+    if len(acc) < n:
+        return np.concatenate([acc, np.full(n - len(acc), fill,
+                                            dtype=acc.dtype)])
+    return acc
+
+
+def _aggregate(state, agg, codes, col, ngroups):
+    """
+    `_aggregate` updates the partial aggregate in the dictionary `state`
+    with the cells of one batch of the masked array `col`, where `codes`
+    gives the group of each cell.
+    """
+    valid = ~np.ma.getmaskarray(col)
+    codes = codes[valid]
+    values = np.ma.getdata(col)[valid]
+    numeric = values.dtype.kind in 'if'
+
+    state['count'] = _grow(state.get('count'), ngroups, 0, np.int64) \
+        + np.bincount(codes, minlength=ngroups)
+    if agg in ('sum', 'mean'):
+        if values.dtype.kind == 'f':
+            sums = np.bincount(codes, weights=values, minlength=ngroups)
+        else:
+            sums = _int_sums(codes, values, ngroups)
+        state['sum'] = _grow(state.get('sum'), ngroups, 0, sums.dtype) + sums
+    elif agg in ('min', 'max') and numeric:
+        if values.dtype.kind == 'f':
+            fill = np.inf if agg == 'min' else -np.inf
+        else:
+            info = np.iinfo(values.dtype)
+            fill = info.max if agg == 'min' else info.min
+        acc = state[agg] = _grow(state.get(agg), ngroups, fill, values.dtype)
+        (np.minimum if agg == 'min' else np.maximum).at(acc, codes, values)
+    elif agg in ('min', 'max'):
+        acc = state.setdefault(agg, [])
+        acc.extend([None] * (ngroups - len(acc)))
+        better = operator.lt if agg == 'min' else operator.gt
+        for code, value in zip(codes.tolist(), values.tolist()):
+            if acc[code] is None or better(value, acc[code]):
+                acc[code] = value
+    elif agg == 'distinct':
+        acc = state.setdefault(agg, [])
+        acc.extend(set() for _ in range(ngroups - len(acc)))
+        for code, value in set(zip(codes.tolist(), values.tolist())):
+            acc[code].add(value)
+
+
+def _int_sums(codes, values, ngroups):
+    """
+    `_int_sums` returns the exact sum of the integers in `values` in each
+    group given by `codes`, as an array of Python ints. The sums are
+    computed with `int64` when they can't overflow it.
+    """
+    bound = 2 ** 63 // max(len(values), 1)
+    if values.dtype.kind == 'i' \
+            and (len(values) == 0
+                 or (values.max() < bound and values.min() > -bound)):
+        sums = np.zeros(ngroups, dtype=np.int64)
+        np.add.at(sums, codes, values)
+        return sums.astype(object)
+    acc = [0] * ngroups
+    for code, value in zip(codes.tolist(), values.tolist()):
+        acc[code] += value
+    sums = np.empty(ngroups, dtype=object)
+    sums[:] = acc
+    return sums
+
+
+def _aggregated(state, agg, ngroups):
+    """
+    `_aggregated` returns the final values of an aggregate for each
+    group from its partial aggregate `state`.
+    """
+    counts = _grow(state.get('count'), ngroups, 0, np.int64)
+    empty = (counts == 0).tolist()
+    if agg == 'count':
+        return counts.tolist()
+    elif agg == 'distinct':
+        acc = state.get(agg, [])
+        return [len(acc[g]) if g < len(acc) else 0 for g in range(ngroups)]
+    elif agg == 'mean':
+        sums = _grow(state.get('sum'), ngroups, 0, np.float64)
+        values = [s / c if c > 0 else None
+                  for s, c in zip(sums.tolist(), counts.tolist())]
+    elif agg == 'sum':
+        values = _grow(state.get('sum'), ngroups, 0, np.int64).tolist()
+    else:
+        values = state.get(agg, [])
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        values = values + [None] * (ngroups - len(values))
+    return [None if e else v for e, v in zip(empty, values)]
+
+
+def join(left, right, on, how='inner', right_on=None, suffix='_right'):
+    """
+    `join` returns a `qcsv.Table` with each pair of rows from `left` and
+    `right` that have equal values in their key columns. `on` is a column
+    name or a list of names in `left`, and `right_on` names the key
+    columns of `right` if they differ from `on`.
+
+    When `how` is `inner`, only matching rows are kept. When it is
+    `left`, rows of `left` that don't match any row in `right` are kept
+    too, with `None` in each column from `right`. A key with a NULL
+    cell never matches anything. Keys are compared by Python equality,
+    so an `int` key of `1` matches a `float` key of `1.0`.
+
+    The result has every column of `left`, followed by every column of
+    `right` except its key columns. If a name from `right` is already
+    taken, `suffix` is appended to it.
+
+    A hash table is built from the keys of the smaller table, and the
+    other table is scanned for matches. Rows are in the order of `left`,
+    and the matches for each row are in the order of `right`. One of the
+    tables may be streamed (see `qcsv.stream`), in which case the hash
+    table is built from the other one, and the rows of the result are
+    an iterator in the order of the streamed table. (For a left join
+    with a streamed `right`, the rows of `left` without a match come
+    last.)
+    """
+    assert how in ('inner', 'left'), 'Unknown join %s' % how
+    if isinstance(on, text_type):
+        on = [on]
+    if right_on is None:
+        right_on = on
+    elif isinstance(right_on, text_type):
+        right_on = [right_on]
+    assert len(on) == len(right_on), 'Both tables need the same number ' \
+                                     'of key columns'
+    left, right = to_rows(left), to_rows(right)
+    lstream = not isinstance(left.rows, list)
+    rstream = not isinstance(right.rows, list)
+    assert not (lstream and rstream), 'Only one table may be streamed'
+
+    lkey, rkey = _join_key(left, on), _join_key(right, right_on)
+    keys = set(right.column_index(name) for name in right_on)
+    rkeep = [c for c in range(len(right.names)) if c not in keys]
+    names, types = list(left.names), dict(left.types)
+    taken = set(name.lower() for name in names)
+    for c in rkeep:
+        name = right.names[c]
+        while name.lower() in taken:
+            name += suffix
+        taken.add(name.lower())
+        names.append(name)
+        types[name] = right.types[right.names[c]]
+
+    project = _projector(rkeep)
+    missing = [None] * len(rkeep) if how == 'left' else None
+    if rstream or (not lstream and len(left.rows) < len(right.rows)):
+        rows = _join_build_left(left.rows, right.rows, lkey, rkey, project,
+                                missing)
+        if not rstream:
+            rows = list(rows)
+    else:
+        rows = _join_build_right(left.rows, right.rows, lkey, rkey, project,
+                                 missing)
+        if not lstream:
+            rows = list(rows)
+    return Table(types=types, names=names, rows=rows)
+
+
+def _join_key(table, names):
+    """
+    `_join_key` returns a function that gets the key of a row of `table`
+    from the columns `names`, or `None` if any of its cells is `None`.
+    """
+    idx = [table.column_index(name) for name in names]
+    if len(idx) == 1:
+        return itemgetter(idx[0])
+    getter = itemgetter(*idx)
+
+    def key(row):
+        k = getter(row)
+        return None if None in k else k
+    return key
+
+
+def _join_build_right(lrows, rrows, lkey, rkey, project, missing):
+    """
+    `_join_build_right` joins rows by hashing the keys of `rrows` and
+    scanning `lrows`. If `missing` isn't `None`, it is appended to the
+    rows of `lrows` without a match.
+    """
+    matches = {}
+    for row in rrows:
+        k = rkey(row)
+        if k is not None:
+            matches.setdefault(k, []).append(project(row))
+    for row in lrows:
+        found = matches.get(lkey(row))
+        if found is not None:
+            for other in found:
+                yield row + other
+        elif missing is not None:
+            yield row + missing
+
+
+def _join_build_left(lrows, rrows, lkey, rkey, project, missing):
+    """
+    `_join_build_left` joins rows by hashing the keys of `lrows` and
+    scanning `rrows`. When `rrows` is a list, the result is in the order
+    of `lrows`. Otherwise, rows are joined as `rrows` is consumed.
+    """
+    index = {}
+    for i, row in enumerate(lrows):
+        k = lkey(row)
+        if k is not None:
+            index.setdefault(k, []).append(i)
+
+    if isinstance(rrows, list):
+        found = [[] for _ in lrows]
+        for row in rrows:
+            for i in index.get(rkey(row), ()):
+                found[i].append(project(row))
+        for row, others in zip(lrows, found):
+            for other in others:
+                yield row + other
+            if len(others) == 0 and missing is not None:
+                yield row + missing
+        return
+
+    matched = [False] * len(lrows)
+    for row in rrows:
+        for i in index.get(rkey(row), ()):
+            matched[i] = True
+            yield lrows[i] + project(row)
+    if missing is not None:
+        for row, m in zip(lrows, matched):
+            if not m:
+                yield row + missing
 
 
 def type_str(typ):
@@ -370,33 +3052,98 @@ def cell_str(cell_contents):
     return str(cell_contents)
 
 
-def print_data_table(table):
+def print_data_table(table, out=None, head=None, tail=None, sample=1000):
     """
     `print_data_table` is a convenience function for pretty-printing
     the data in tabular format, including header names and type
     annotations.
+
+    The table is written to the file object `out`, or to standard output
+    by default. If `head` is set, only that many rows from the start of
+    the table are printed, and if `tail` is set, only that many rows
+    from the end. (When both are set, a line with `...` marks any rows
+    skipped in between.)
+
+    Column widths fit the header and the first `sample` rows that are
+    printed, and each row after those is written as soon as it is
+    formatted, so printing starts right away even for a streamed table.
+    A later cell that is wider than its column pushes the rest of its
+    row to the right.
     """
-    padding = 2
+    table = collect(table)
+    out = sys.stdout if out is None else out
+    pad = ' ' * 2
     headers = ['%s (%s)' % (n, type_str(table.types[n])) for n in table.names]
+    rows = (None if row is None else list(map(cell_str, row))
+            for row in _printed_rows(table, head, tail))
+    buffered = list(itertools.islice(rows, sample))
     maxlens = list(map(len, headers))
-    for row in table.rows:
-        for i, col in enumerate(row):
-            maxlens[i] = max(maxlens[i], len(cell_str(col)))
-
-    def padded_cell(i, s):
-        spaces = maxlens[i] - len(cell_str(s)) + padding
-        return '%s%s' % (cell_str(s), ' ' * spaces)
-
-    line = ""
-    for i, name in enumerate(headers):
-        line += padded_cell(i, name)
-    print(line)
-    print('-' * (sum(map(len, headers)) + len(headers) * padding))
-    for row in table.rows:
-        line = ""
-        for i, col in enumerate(row):
-            line += padded_cell(i, cell_str(col))
-        print(line)
+    for row in buffered:
+        if row is not None:
+            maxlens = list(map(max, maxlens, map(len, row)))
+
+    def line(cells):
+        return ''.join([s.ljust(n) + pad for s, n in zip(cells, maxlens)])
+    out.write(line(headers) + '\n')
+    out.write('-' * (sum(map(len, headers)) + len(headers) * len(pad)))
+    out.write('\n')
+    for row in itertools.chain(buffered, rows):
+        out.write('...\n' if row is None else line(row) + '\n')
+
+
+def _printed_rows(table, head, tail):
+    """
+    `_printed_rows` returns an iterator over the rows of `table` that are
+    selected by `head` and `tail`, as described in
+    `qcsv.print_data_table`. `None` takes the place of any rows skipped
+    between them.
+    """
+    if isinstance(table, Table) and not isinstance(table.rows, list):
+        return _printed_stream(iter(table.rows), head, tail)
+    n = _nrows(table)
+    if head is None and tail is None:
+        return iter(_row_slice(table, 0, n))
+    a = 0 if head is None else min(head, n)
+    b = n if tail is None else max(n - tail, a)
+    skipped = [None] if head is not None and tail is not None and b > a \
+        else []
+    return itertools.chain(_row_slice(table, 0, a), skipped,
+                           _row_slice(table, b, n))
+
+
+def _printed_stream(rows, head, tail):
+    """
+    `_printed_stream` is like `qcsv._printed_rows` for an iterator of
+    rows. Only the last `tail` rows are kept in memory.
+    """
+    if head is not None:
+        for row in itertools.islice(rows, head):
+            yield row
+    if tail is None:
+        if head is None:
+            for row in rows:
+                yield row
+        return
+    last = deque(rows, maxlen=tail + 1)
+    if len(last) > tail:
+        if head is not None:
+            yield None
+        last.popleft()
+    for row in last:
+        yield row
+
+
+def _row_slice(table, a, b):
+    """
+    `_row_slice` returns a list of the rows of `table` from `a` up to
+    `b`. Only those rows of a `qcsv.ColumnTable` are converted.
+    """
+    if not isinstance(table, ColumnTable):
+        return table.rows[a:b]
+    cols = [col._replace(codes=col.codes[a:b])
+            if isinstance(col, Categorical) else col[a:b]
+            for col in table.columns]
+    return to_rows(table._replace(columns=cols)).rows
 
 
 if __name__ == '__main__':
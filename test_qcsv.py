@@ -0,0 +1,92 @@
+"""
+Tests for qcsv.
+
+Run with `python -m pytest test_qcsv.py` or
+`python -m unittest test_qcsv`.
+"""
+from __future__ import absolute_import, division, print_function
+import itertools
+import random
+import unittest
+
+import qcsv
+
+
+def reference_column_types(names, rows):
+    """
+    `reference_column_types` is the original implementation of
+    `qcsv._column_types`, which tries `int` and then `float` on every
+    cell. The vectorized version must always agree with it.
+    """
+    types = dict([(name, None) for name in names])
+
+    for c in range(len(names)):
+        prev_typ = None
+        next_typ = None
+        for row in rows:
+            col = row[c]
+            if len(col) == 0:
+                next_typ = None
+            elif prev_typ is not str:
+                try:
+                    int(col)
+                    next_typ = int
+                except ValueError:
+                    try:
+                        float(col)
+                        next_typ = float
+                    except ValueError:
+                        next_typ = str
+
+            if prev_typ is str or next_typ is str:
+                prev_typ = str
+            elif next_typ is float and prev_typ is int:
+                prev_typ = float
+            elif prev_typ is None and next_typ is not None:
+                prev_typ = next_typ
+        types[names[c]] = prev_typ
+    return types
+
+
+CELLS = [
+    '', ' ', '\t', '0', '1', '-1', '+1', ' 1', '1 ', ' -7 ', '+-1', '--1',
+    '1_000', '_1', '1_', '1__0', '+', '-', '_',
+    u'٣', u'١٢', u'-٣', u'²', u'1²',
+    u' ', u' 1 ',
+    '1.5', '-.5', '1.', '.', '1e5', '1E-5', '1e400', '-1e400', '1_0.5',
+    'inf', '-inf', 'Infinity', 'nan', 'NaN', '-nan',
+    str(2 ** 63), str(-2 ** 63 - 1), '9' * 40,
+    'abc', 'e', '1e', '0x10', '1,000', '1 2',
+]
+
+
+class TestColumnTypes(unittest.TestCase):
+    def assertSameTypes(self, names, rows):
+        self.assertEqual(qcsv._column_types(names, rows),
+                         reference_column_types(names, rows),
+                         repr(rows))
+
+    def test_single_cells(self):
+        for cell in CELLS:
+            self.assertSameTypes(['a'], [[cell]])
+
+    def test_pairs(self):
+        pairs = list(itertools.product(CELLS, repeat=2))
+        names = ['c%d' % i for i in range(len(pairs))]
+        self.assertSameTypes(names, [list(row) for row in zip(*pairs)])
+
+    def test_random_columns(self):
+        rng = random.Random(0)
+        names = ['c%d' % i for i in range(200)]
+        columns = [[rng.choice(CELLS) for _ in range(rng.randint(0, 6))]
+                   for _ in names]
+        nrows = max(len(col) for col in columns)
+        columns = [col + [''] * (nrows - len(col)) for col in columns]
+        self.assertSameTypes(names, [list(row) for row in zip(*columns)])
+
+    def test_no_rows(self):
+        self.assertSameTypes(['a', 'b'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()